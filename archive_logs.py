@@ -0,0 +1,109 @@
+"""
+Compress finished NNI trial logs in place.
+
+Every `trial.log` below `<nni_dir>/<experiment_id>/environments/local-env/trials/` that has not been written to for
+`--min_age` hours is replaced by `trial.log.gz` (or `trial.log.zst` with the zstandard package). The compressed
+copy is written next to the log, keeps its modification time and is moved into place before the original is
+removed, so an interrupted run never loses a log. The parse scripts read the compressed logs transparently.
+"""
+import os
+import glob
+import gzip
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from trial_scanner import TRIALS_SUBDIR, zstandard
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def finished_logs(nni_dir, min_age_hours=24, experiment_ids=None):
+    """Uncompressed trial logs that have not been modified for `min_age_hours`, sorted by path."""
+    experiments = experiment_ids or ["*"]
+    paths = []
+    for experiment_id in experiments:
+        paths.extend(glob.glob(os.path.join(glob.escape(nni_dir), experiment_id, TRIALS_SUBDIR, "*", "trial.log")))
+    cutoff = time.time() - min_age_hours * 3600
+    return sorted(path for path in paths if os.stat(path).st_mtime < cutoff)
+
+
+def compress_log(task):
+    """
+    Compress one `(trial_log_path, compression, level)` task. Module level so it can run in a worker process.
+
+    Returns `(trial_log_path, original size, compressed size)`, with a compressed size of None on errors.
+    """
+    trial_log_path, compression, level = task
+    target = f"{trial_log_path}.{compression}"
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        stat = os.stat(trial_log_path)
+        with open(trial_log_path, "rb") as source, open(tmp_path, "wb") as raw:
+            if compression == "gz":
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0) as compressed:
+                    shutil.copyfileobj(source, compressed, COPY_BLOCK_SIZE)
+            else:
+                compressor = zstandard.ZstdCompressor(level=level)
+                compressor.copy_stream(source, raw, size=stat.st_size, read_size=COPY_BLOCK_SIZE)
+            raw.flush()
+            os.fsync(raw.fileno())
+        # Keep the modification time so age-based tools (and this script) see when the trial really finished
+        os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp_path, target)
+        os.remove(trial_log_path)
+        return trial_log_path, stat.st_size, os.path.getsize(target)
+    except OSError as e:
+        print(f"Error compressing trial log {trial_log_path}: {e}")
+        return trial_log_path, 0, None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def archive_logs(nni_dir, compression="gz", level=None, min_age_hours=24, experiment_ids=None, workers=1,
+                 dry_run=False):
+    if compression == "zst" and zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package (pip install zstandard).")
+    if level is None:
+        level = 6 if compression == "gz" else 10
+
+    paths = finished_logs(nni_dir, min_age_hours=min_age_hours, experiment_ids=experiment_ids)
+    if dry_run:
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f"{len(paths)} trial logs ({total / 1e6:.1f} MB) would be compressed.")
+        return []
+
+    tasks = [(path, compression, level) for path in paths]
+    if workers > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(compress_log, tasks, chunksize=chunksize))
+    else:
+        results = [compress_log(task) for task in tasks]
+
+    compressed = [(size, compressed_size) for _, size, compressed_size in results if compressed_size is not None]
+    before = sum(size for size, _ in compressed)
+    after = sum(compressed_size for _, compressed_size in compressed)
+    print(f"Compressed {len(compressed)} of {len(paths)} trial logs: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress finished NNI trial logs in place.")
+    parser.add_argument("nni_dir", type=str, help="Path to the NNI directory.")
+    parser.add_argument("--compression", type=str, choices=["gz", "zst"], default="gz",
+                        help="Compression format (zst requires the zstandard package).")
+    parser.add_argument("--level", type=int, default=None, help="Compression level (default: 6 for gz, 10 for zst).")
+    parser.add_argument("--min_age", type=float, default=24,
+                        help="Only compress logs that have not been modified for this many hours.")
+    parser.add_argument("--experiment_id", type=str, nargs="+", default=None, dest="experiment_ids",
+                        help="Only compress the logs of these experiments.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes compressing logs in parallel.")
+    parser.add_argument("--dry_run", action="store_true", help="Only report how many logs would be compressed.")
+    args = parser.parse_args()
+
+    nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
+    archive_logs(nni_dir, compression=args.compression, level=args.level, min_age_hours=args.min_age,
+                 experiment_ids=args.experiment_ids, workers=args.workers, dry_run=args.dry_run)
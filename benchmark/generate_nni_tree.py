@@ -0,0 +1,278 @@
+"""
+Generate a synthetic NNI experiment tree for benchmarking the result parsers.
+
+Creates the layout the parse scripts expect:
+
+    <output_dir>/<task>/experiments/<model>/<dataset>/{experiment_id.txt, hpset_<model>_<dataset>.json, config.yml}
+    <output_dir>/nni-experiments/<experiment_id>/environments/local-env/trials/<trial_id>/trial.log
+    <output_dir>/nni-experiments/<experiment_id>/db/nni.sqlite                      (with --db)
+
+The trial logs mimic the output of run_ner.py/run_classification.py under the HF Trainer: the TrainingArguments
+dump, tqdm progress bars, per-step loss and per-epoch eval dicts, and the final train/eval/predict metric blocks
+(including entity metrics for NER). A fraction of the trials can be made to fail before the final blocks.
+"""
+import os
+import json
+import random
+import sqlite3
+import string
+import argparse
+
+MODELS = ["christbert", "christbert_scratch", "christbert_bpe", "medbertde", "biogottbert", "geistbert", "geberta"]
+DATASETS = {
+    "ner": ["bronco", "cardiode", "ggponc2"],
+    "cls": ["jsynCC", "ggponc2", "cardiode"],
+}
+ENTITIES = ["Diagnosis", "Medication", "Treatment", "Anatomy", "Drug", "Dosage", "Frequency", "Duration",
+            "Procedure", "Finding", "Symptom", "Test"]
+LEARNING_RATES = [7e-05, 5e-05, 2e-05, 1e-05, 7e-06, 5e-06, 1e-06]
+BATCH_SIZES = [16, 32, 48, 64]
+
+
+def random_id(rng, length, alphabet):
+    return "".join(rng.choices(alphabet, k=length))
+
+
+def format_runtime(seconds):
+    # Same format as the HF Trainer's log_metrics
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02d}:{seconds:05.2f}"
+
+
+def metrics_block(split, metrics):
+    # HF Trainer log_metrics: keys padded to the longest key, values right-aligned
+    key_width = max(len(key) for key in metrics)
+    value_width = max(len(str(value)) for value in metrics.values())
+    lines = [f"***** {split} metrics *****\n"]
+    lines.extend(f"  {key: <{key_width}} = {str(value):>{value_width}}\n" for key, value in metrics.items())
+    return "".join(lines)
+
+
+def progress_bar(rng, total, steps_per_line=1):
+    # tqdm writes carriage-return separated updates, so the whole bar ends up on one line
+    updates = []
+    for step in range(0, total + 1, steps_per_line):
+        percent = step * 100 // total
+        updates.append(f"\r {percent:3d}%|{'#' * (percent // 10):<10}| {step}/{total} "
+                       f"[00:{step // 10:02d}<00:{(total - step) // 10:02d}, {rng.uniform(5, 15):.2f}it/s]")
+    return "".join(updates) + "\n"
+
+
+def split_metrics(rng, prefix, task, entities, quality):
+    def score():
+        return round(min(1.0, max(0.0, rng.gauss(quality, 0.05))), 4)
+
+    metrics = {f"{prefix}_loss": round(rng.uniform(0.05, 0.6), 4)}
+    if task == "ner":
+        for entity in entities:
+            metrics[f"{prefix}_{entity}_f1"] = score()
+            metrics[f"{prefix}_{entity}_number"] = rng.randint(10, 2000)
+            metrics[f"{prefix}_{entity}_precision"] = score()
+            metrics[f"{prefix}_{entity}_recall"] = score()
+    for average in ["macro", "micro", "weighted"]:
+        metrics[f"{prefix}_{average}_f1"] = score()
+        metrics[f"{prefix}_{average}_precision"] = score()
+        metrics[f"{prefix}_{average}_recall"] = score()
+    metrics[f"{prefix}_overall_accuracy" if task == "ner" else f"{prefix}_accuracy"] = score()
+    return metrics
+
+
+def trial_log(rng, task, entities, learning_rate, batch_size, epochs, steps_per_epoch, failed):
+    """Text of one trial.log; also returns the per-epoch intermediate results and the final result."""
+    quality = rng.uniform(0.5, 0.9)
+    lines = [
+        "***** Task starting *****\n",
+        "INFO - __main__ - Training/evaluation parameters TrainingArguments(\n",
+        "_n_gpu=1,\n",
+        "adafactor=False,\n",
+        "adam_beta1=0.9,\n",
+        "adam_beta2=0.999,\n",
+        "adam_epsilon=1e-08,\n",
+        "eval_strategy=IntervalStrategy.EPOCH,\n",
+        "fp16=False,\n",
+        "gradient_accumulation_steps=1,\n",
+        f"learning_rate={learning_rate},\n",
+        "load_best_model_at_end=True,\n",
+        "logging_steps=50,\n",
+        "lr_scheduler_type=SchedulerType.LINEAR,\n",
+        "metric_for_best_model=loss,\n",
+        f"num_train_epochs={epochs},\n",
+        "per_device_eval_batch_size=8,\n",
+        f"per_device_train_batch_size={batch_size},\n",
+        "save_strategy=IntervalStrategy.EPOCH,\n",
+        "seed=42,\n",
+        "warmup_ratio=0.0,\n",
+        "weight_decay=0.0,\n",
+        ")\n",
+        "INFO - datasets.builder - Loading Dataset Infos\n",
+        "***** Running training *****\n",
+    ]
+    intermediate = []
+    eval_metric = "eval_micro_f1" if task == "ner" else "eval_macro_f1"
+    total_steps = epochs * steps_per_epoch
+    train_seconds = 0.0
+    for epoch in range(1, epochs + 1):
+        lines.append(progress_bar(rng, steps_per_epoch))
+        for step in range(50, steps_per_epoch + 1, 50):
+            lines.append(f"{{'loss': {rng.uniform(0.05, 1.0):.4f}, 'grad_norm': {rng.uniform(0.5, 5.0):.4f}, "
+                         f"'learning_rate': {learning_rate * (1 - ((epoch - 1) * steps_per_epoch + step) / total_steps):.3e}, "
+                         f"'epoch': {epoch - 1 + step / steps_per_epoch:.2f}}}\n")
+        if failed and epoch == epochs:
+            lines.append("Traceback (most recent call last):\n")
+            lines.append("torch.OutOfMemoryError: CUDA out of memory.\n")
+            return "".join(lines), intermediate, None
+
+        eval_runtime = rng.uniform(1.0, 20.0)
+        epoch_result = round(min(1.0, max(0.0, quality - 0.1 / epoch + rng.gauss(0, 0.01))), 4)
+        intermediate.append(epoch_result)
+        lines.append(progress_bar(rng, max(1, steps_per_epoch // 10)))
+        lines.append(f"{{'eval_loss': {rng.uniform(0.05, 0.6):.4f}, '{eval_metric}': {epoch_result}, "
+                     f"'eval_runtime': {eval_runtime:.4f}, 'eval_samples_per_second': {rng.uniform(50, 300):.3f}, "
+                     f"'eval_steps_per_second': {rng.uniform(5, 40):.3f}, 'epoch': {float(epoch)}}}\n")
+        train_seconds += rng.uniform(30.0, 600.0)
+
+    train_samples = steps_per_epoch * batch_size
+    lines.append(f"{{'train_runtime': {train_seconds:.4f}, 'train_samples_per_second': {train_samples * epochs / train_seconds:.3f}, "
+                 f"'train_steps_per_second': {total_steps / train_seconds:.3f}, 'train_loss': {rng.uniform(0.05, 0.5):.4f}, "
+                 f"'epoch': {float(epochs)}}}\n")
+    lines.append(metrics_block("train", {
+        "epoch": float(epochs),
+        "total_flos": f"{rng.randint(100000, 9000000)}GF",
+        "train_loss": round(rng.uniform(0.05, 0.5), 4),
+        "train_runtime": format_runtime(train_seconds),
+        "train_samples": train_samples,
+        "train_samples_per_second": round(train_samples * epochs / train_seconds, 3),
+        "train_steps_per_second": round(total_steps / train_seconds, 3),
+    }))
+    for split in ["eval", "predict"]:
+        runtime = rng.uniform(1.0, 30.0)
+        samples = rng.randint(200, 5000)
+        metrics = split_metrics(rng, split, task, entities, quality)
+        if split == "eval":
+            metrics = {"epoch": float(epochs), **metrics}
+        metrics.update({
+            f"{split}_runtime": format_runtime(runtime),
+            f"{split}_samples": samples,
+            f"{split}_samples_per_second": round(samples / runtime, 3),
+            f"{split}_steps_per_second": round(samples / runtime / 8, 3),
+        })
+        lines.append(progress_bar(rng, max(1, samples // 8), steps_per_line=max(1, samples // 80)))
+        lines.append(metrics_block(split, metrics))
+    final = metrics["predict_micro_f1" if task == "ner" else "predict_macro_f1"]
+    return "".join(lines), intermediate, final
+
+
+def write_db(experiment_dir, trials):
+    """Write the trial events and metrics of an experiment to an NNI-style db/nni.sqlite."""
+    os.makedirs(os.path.join(experiment_dir, "db"), exist_ok=True)
+    connection = sqlite3.connect(os.path.join(experiment_dir, "db", "nni.sqlite"))
+    connection.execute("CREATE TABLE TrialJobEvent (timestamp integer, trialJobId text, event text, data text, "
+                       "logPath text, sequenceId integer, message text)")
+    connection.execute("CREATE TABLE MetricData (timestamp integer, trialJobId text, parameterId text, type text, "
+                       "sequence integer, data text)")
+    events = []
+    metrics = []
+    timestamp = 1700000000000
+    for sequence, (trial_id, parameters, intermediate, final) in enumerate(trials):
+        data = json.dumps({"parameter_id": sequence, "parameter_source": "algorithm", "parameters": parameters,
+                           "parameter_index": 0})
+        events.append((timestamp, trial_id, "WAITING", data, None, sequence, None))
+        events.append((timestamp + 1000, trial_id, "RUNNING", None, None, sequence, None))
+        for epoch, value in enumerate(intermediate):
+            metrics.append((timestamp + 2000 + epoch, trial_id, str(sequence), "PERIODICAL", epoch,
+                            json.dumps(json.dumps(value))))
+        if final is None:
+            events.append((timestamp + 9000, trial_id, "FAILED", None, None, sequence, None))
+        else:
+            metrics.append((timestamp + 8000, trial_id, str(sequence), "FINAL", 0, json.dumps(json.dumps(final))))
+            events.append((timestamp + 9000, trial_id, "SUCCEEDED", None, None, sequence, None))
+        timestamp += 10000
+    connection.executemany("INSERT INTO TrialJobEvent VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+    connection.executemany("INSERT INTO MetricData VALUES (?, ?, ?, ?, ?, ?)", metrics)
+    connection.commit()
+    connection.close()
+
+
+def generate_tree(output_dir, task="ner", models=2, datasets=2, trials=10, epochs=3, steps_per_epoch=200,
+                  entities=8, failed_fraction=0.05, db=False, seed=0):
+    """
+    Generate `models * datasets` experiments with `trials` trials each below `output_dir`.
+
+    Returns the task directory (the `base_dir` of the parse scripts) and the NNI directory.
+    """
+    rng = random.Random(seed)
+    task_dir = os.path.join(output_dir, task)
+    nni_dir = os.path.join(output_dir, "nni-experiments")
+    model_names = (MODELS * (models // len(MODELS) + 1))[:models]
+    model_names = [name if i < len(MODELS) else f"{name}_{i}" for i, name in enumerate(model_names)]
+    dataset_names = (DATASETS[task] * (datasets // len(DATASETS[task]) + 1))[:datasets]
+    dataset_names = [name if i < len(DATASETS[task]) else f"{name}_{i}" for i, name in enumerate(dataset_names)]
+
+    for model_name in model_names:
+        for dataset_name in dataset_names:
+            experiment_path = os.path.join(task_dir, "experiments", model_name, dataset_name)
+            os.makedirs(experiment_path, exist_ok=True)
+            experiment_id = random_id(rng, 8, string.ascii_lowercase + string.digits)
+            with open(os.path.join(experiment_path, "experiment_id.txt"), "w") as f:
+                f.write(experiment_id + "\n")
+            with open(os.path.join(experiment_path, f"hpset_{model_name}_{dataset_name}.json"), "w") as f:
+                json.dump({
+                    "max_seq_length": {"_type": "choice", "_value": [128 if dataset_name == "ggponc2" else 64]},
+                    "learning_rate": {"_type": "choice", "_value": LEARNING_RATES},
+                    "per_device_train_batch_size": {"_type": "choice", "_value": BATCH_SIZES},
+                }, f, indent=4)
+            with open(os.path.join(experiment_path, "config.yml"), "w") as f:
+                f.write(f"experimentName: {model_name}_{dataset_name}\n"
+                        f"searchSpaceFile: hpset_{model_name}_{dataset_name}.json\n")
+
+            # Each dataset has its own entity types, as in the real NER corpora
+            dataset_entities = rng.sample(ENTITIES, min(entities, len(ENTITIES)))
+            experiment_dir = os.path.join(nni_dir, experiment_id)
+            db_trials = []
+            trial_ids = set()
+            for _ in range(trials):
+                trial_id = random_id(rng, 5, string.ascii_letters)
+                while trial_id in trial_ids:
+                    trial_id = random_id(rng, 5, string.ascii_letters)
+                trial_ids.add(trial_id)
+                learning_rate = rng.choice(LEARNING_RATES)
+                batch_size = rng.choice(BATCH_SIZES)
+                failed = rng.random() < failed_fraction
+                text, intermediate, final = trial_log(rng, task, dataset_entities, learning_rate, batch_size, epochs,
+                                                      steps_per_epoch, failed)
+                trial_dir = os.path.join(experiment_dir, "environments", "local-env", "trials", trial_id)
+                os.makedirs(trial_dir, exist_ok=True)
+                with open(os.path.join(trial_dir, "trial.log"), "w") as f:
+                    f.write(text)
+                db_trials.append((trial_id, {"learning_rate": learning_rate, "per_device_train_batch_size": batch_size},
+                                  intermediate, final))
+            if db:
+                write_db(experiment_dir, db_trials)
+    return task_dir, nni_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic NNI experiment tree for benchmarking.")
+    parser.add_argument("output_dir", type=str, help="Directory to create the task and nni-experiments directories in.")
+    parser.add_argument("--task", type=str, choices=["ner", "cls"], default="ner", help="Task of the experiments.")
+    parser.add_argument("--models", type=int, default=2, help="Number of models.")
+    parser.add_argument("--datasets", type=int, default=2, help="Number of datasets.")
+    parser.add_argument("--trials", type=int, default=10, help="Number of trials per experiment.")
+    parser.add_argument("--epochs", type=int, default=3, help="Number of epochs per trial.")
+    parser.add_argument("--steps_per_epoch", type=int, default=200,
+                        help="Training steps per epoch; controls the size of the progress bars and loss logs.")
+    parser.add_argument("--entities", type=int, default=8, help="Number of entity types per NER dataset.")
+    parser.add_argument("--failed_fraction", type=float, default=0.05,
+                        help="Fraction of trials that fail before writing their final metrics.")
+    parser.add_argument("--db", action="store_true", help="Also write an NNI database (db/nni.sqlite) per experiment.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(os.path.expanduser(args.output_dir))
+    task_dir, nni_dir = generate_tree(output_dir, task=args.task, models=args.models, datasets=args.datasets,
+                                      trials=args.trials, epochs=args.epochs, steps_per_epoch=args.steps_per_epoch,
+                                      entities=args.entities, failed_fraction=args.failed_fraction, db=args.db,
+                                      seed=args.seed)
+    print(f"Experiments written to {task_dir}")
+    print(f"Trial logs written to {nni_dir}")
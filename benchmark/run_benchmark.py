@@ -0,0 +1,131 @@
+"""
+Time the result parsers end to end on a synthetic (or existing) NNI experiment tree.
+
+Every parser is run as a separate process, exactly as from the command line, `--repeat` times; the fastest run is
+reported together with the input it processed in files/sec and MB/sec. The log-based scripts (parse_results,
+parse_runtime, parse_all --nni_dir) are measured against the trial logs, the best-* scripts against the
+results.csv tables written by parse_results.
+
+Note that repeated runs read the trial logs from the page cache.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+import pandas as pd
+
+from generate_nni_tree import generate_tree
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def input_files(root, file_names):
+    """Number and total (on-disk) size of the files called one of `file_names` below `root`."""
+    count = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(root):
+        for file_name in set(file_names).intersection(filenames):
+            count += 1
+            size += os.path.getsize(os.path.join(dirpath, file_name))
+    return count, size
+
+
+def benchmarks(base_dir, nni_dir, metric, workers):
+    """(name, command, input) of every benchmark, in the order they are run."""
+    workers_args = ["--workers", str(workers)]
+    return [
+        ("parse_results (full scan)", ["parse_results.py", base_dir, "--nni_dir", nni_dir, "--no_manifest",
+                                       "--full_scan", *workers_args], "logs"),
+        ("parse_results (tail)", ["parse_results.py", base_dir, "--nni_dir", nni_dir, "--no_manifest",
+                                  *workers_args], "logs"),
+        ("parse_results (manifest)", ["parse_results.py", base_dir, "--nni_dir", nni_dir, *workers_args], "logs"),
+        ("parse_runtime", ["parse_runtime.py", base_dir, "--nni_dir", nni_dir, "--metric", metric,
+                           *workers_args], "logs"),
+        ("parse_best_hparams", ["parse_best_hparams.py", base_dir, "--metric", metric], "results"),
+        ("parse_best_metrics", ["parse_best_metrics.py", base_dir, "--metric", metric], "results"),
+        ("parse_entity_metrics", ["parse_entity_metrics.py", base_dir, "--metric", metric], "results"),
+        ("parse_all", ["parse_all.py", base_dir, "--metric", metric], "results"),
+        ("parse_all --nni_dir", ["parse_all.py", base_dir, "--nni_dir", nni_dir, "--metric", metric,
+                                 *workers_args], "logs"),
+    ]
+
+
+def run_benchmarks(base_dir, nni_dir, metric, repeat=3, workers=1):
+    # parse_results writes the results.csv files the best-* scripts read, so it has to run once up front
+    subprocess.run([sys.executable, "parse_results.py", base_dir, "--nni_dir", nni_dir], cwd=REPO_DIR, check=True,
+                   stdout=subprocess.DEVNULL)
+    # Trial logs may have been compressed by archive_logs.py
+    inputs = {"logs": input_files(nni_dir, ["trial.log", "trial.log.gz", "trial.log.zst"]),
+              "results": input_files(base_dir, ["results.csv"])}
+
+    rows = []
+    for name, command, input_name in benchmarks(base_dir, nni_dir, metric, workers):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *command], cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        files, size = inputs[input_name]
+        seconds = min(timings)
+        rows.append({
+            "benchmark": name,
+            "input": input_name,
+            "files": files,
+            "mb": round(size / 1e6, 2),
+            "best_seconds": round(seconds, 3),
+            "median_seconds": round(sorted(timings)[len(timings) // 2], 3),
+            "files_per_second": round(files / seconds, 1),
+            "mb_per_second": round(size / 1e6 / seconds, 2),
+        })
+        print(f"{name}: {seconds:.3f}s, {files / seconds:.1f} files/s, {size / 1e6 / seconds:.2f} MB/s")
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the result parsers on a synthetic NNI experiment tree.")
+    parser.add_argument("--base_dir", type=str, default=None,
+                        help="Benchmark an existing task directory instead of generating one (requires --nni_dir).")
+    parser.add_argument("--nni_dir", type=str, default=None, help="NNI directory of an existing task directory.")
+    parser.add_argument("--output_dir", type=str, default=None,
+                        help="Directory to generate the tree in (default: a temporary directory that is removed).")
+    parser.add_argument("--task", type=str, choices=["ner", "cls"], default="ner", help="Task of the generated tree.")
+    parser.add_argument("--models", type=int, default=2, help="Number of generated models.")
+    parser.add_argument("--datasets", type=int, default=2, help="Number of generated datasets.")
+    parser.add_argument("--trials", type=int, default=50, help="Number of generated trials per experiment.")
+    parser.add_argument("--steps_per_epoch", type=int, default=200, help="Training steps per epoch of generated trials.")
+    parser.add_argument("--metric", type=str, default=None,
+                        help="Metric to optimize (default: eval_micro_f1 for NER, eval_macro_f1 for classification).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per benchmark; the fastest is reported.")
+    parser.add_argument("--output", type=str, default=None, help="Save the timings to this CSV file.")
+    args = parser.parse_args()
+
+    temporary_dir = None
+    if args.base_dir:
+        if not args.nni_dir:
+            parser.error("--base_dir requires --nni_dir")
+        base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+        nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
+    else:
+        output_dir = args.output_dir or tempfile.mkdtemp(prefix="nni_benchmark_")
+        temporary_dir = None if args.output_dir else output_dir
+        base_dir, nni_dir = generate_tree(os.path.abspath(os.path.expanduser(output_dir)), task=args.task,
+                                          models=args.models, datasets=args.datasets, trials=args.trials,
+                                          steps_per_epoch=args.steps_per_epoch)
+        print(f"Generated {args.models * args.datasets * args.trials} trials in {output_dir}")
+
+    metric = args.metric or ("eval_macro_f1" if os.path.basename(base_dir) == "cls" else "eval_micro_f1")
+    try:
+        results = run_benchmarks(base_dir, nni_dir, metric, repeat=args.repeat, workers=args.workers)
+    finally:
+        if temporary_dir:
+            shutil.rmtree(temporary_dir)
+
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Results saved to {args.output}")
@@ -0,0 +1,303 @@
+"""
+Bootstrap confidence intervals and paired significance tests for the best trial of every experiment.
+
+The predictions the best trial saved (`trials/<trialJobId>/predictions.txt` of run_ner.py,
+`trials/<trialJobId>/predict_results.txt` of run_classification.py) are scored against the gold labels of the
+test split. Every example is reduced once to per-class TP/FP/FN counts (strict IOB2 entity spans for NER, as
+seqeval computes them in run_ner.py); a resample is then a vector of multinomial weights over the examples, so
+thousands of resamples of all models of a dataset are a single weights @ counts matrix product. All models of a
+dataset share the same resamples, which makes the comparisons paired.
+"""
+import os
+import ast
+import argparse
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from results_io import COLUMNAR_FORMATS, write_table
+from trial_scanner import load_results, select_best
+
+TP, FP, FN = 0, 1, 2
+
+
+def read_ner_predictions(path):
+    """Read a predictions.txt file: one sentence per line, one IOB2 tag per word."""
+    with open(path) as f:
+        return [line.split() for line in f.read().splitlines()]
+
+
+def read_cls_predictions(path):
+    """Read a predict_results.txt file: a header, then `index<TAB>label` (a list of labels for multi-label)."""
+    predictions = []
+    with open(path) as f:
+        next(f)
+        for line in f:
+            label = line.rstrip("\n").split("\t", 1)[1]
+            predictions.append(ast.literal_eval(label) if label.startswith("[") else label)
+    return predictions
+
+
+def read_gold(path, task, split="test", label_column=None):
+    """
+    Read the gold labels of the test split.
+
+    `path` is either a file in the same format as the predictions, a dataset directory written with `save_to_disk`
+    (the dataset paths in create_hpsets_configs.py, which the run scripts open with `load_from_disk`) or a dataset
+    that `datasets.load_dataset` can load. Class ids of a dataset are mapped to label names.
+    """
+    if os.path.isfile(path):
+        return read_ner_predictions(path) if task == "ner" else read_cls_predictions(path)
+
+    if os.path.isdir(path):
+        from datasets import DatasetDict, load_from_disk
+        dataset = load_from_disk(path)
+        if isinstance(dataset, DatasetDict):
+            dataset = dataset[split]
+    else:
+        from datasets import load_dataset
+        dataset = load_dataset(path, split=split)
+    if label_column is None:
+        label_column = "ner_tags" if task == "ner" else "label"
+    feature = dataset.features[label_column]
+    names = getattr(getattr(feature, "feature", feature), "names", None)
+    to_name = (lambda label: names[label]) if names is not None else str
+    labels = dataset[label_column]
+    if task == "ner" or isinstance(labels[0], list):
+        return [[to_name(label) for label in example] for example in labels]
+    return [to_name(label) for label in labels]
+
+
+def iob2_spans(tags):
+    """Entity spans `(type, start, end)` of a sentence in strict IOB2: a B-X followed by any number of I-X."""
+    spans = []
+    entity_type = None
+    start = None
+    for i, tag in enumerate(tags + ["O"]):
+        prefix, _, tag_type = tag.partition("-")
+        if entity_type is not None and not (prefix == "I" and tag_type == entity_type):
+            spans.append((entity_type, start, i))
+            entity_type = None
+        if prefix == "B":
+            entity_type, start = tag_type, i
+    return spans
+
+
+def ner_counts(gold, predictions):
+    """Per-sentence TP/FP/FN counts of every entity type; returns `(counts[n, types, 3], types)`."""
+    gold_spans = [set(iob2_spans(tags)) for tags in gold]
+    predicted_spans = [set(iob2_spans(tags)) for tags in predictions]
+    types = sorted({span[0] for spans in gold_spans + predicted_spans for span in spans})
+    type_ids = {entity_type: i for i, entity_type in enumerate(types)}
+    counts = np.zeros((len(gold), len(types), 3))
+    for i, (gold_set, predicted_set) in enumerate(zip(gold_spans, predicted_spans)):
+        for span in gold_set & predicted_set:
+            counts[i, type_ids[span[0]], TP] += 1
+        for span in predicted_set - gold_set:
+            counts[i, type_ids[span[0]], FP] += 1
+        for span in gold_set - predicted_set:
+            counts[i, type_ids[span[0]], FN] += 1
+    return counts, types
+
+
+def cls_counts(gold, predictions):
+    """Per-example TP/FP/FN counts of every class (multi-label: any number of classes); returns `(counts, classes)`."""
+    as_sets = lambda labels: [set(label) if isinstance(label, (list, tuple)) else {label} for label in labels]
+    gold_sets, predicted_sets = as_sets(gold), as_sets(predictions)
+    classes = sorted(set().union(*gold_sets, *predicted_sets))
+    class_ids = {label: i for i, label in enumerate(classes)}
+
+    def multi_hot(label_sets):
+        encoded = np.zeros((len(label_sets), len(classes)), dtype=bool)
+        for i, labels in enumerate(label_sets):
+            encoded[i, [class_ids[label] for label in labels]] = True
+        return encoded
+
+    gold_hot, predicted_hot = multi_hot(gold_sets), multi_hot(predicted_sets)
+    counts = np.stack([gold_hot & predicted_hot, predicted_hot & ~gold_hot, gold_hot & ~predicted_hot], axis=-1)
+    return counts.astype(float), classes
+
+
+def f1_scores(counts):
+    """
+    Micro and macro F1 of TP/FP/FN counts of shape `(..., classes, 3)`.
+
+    The macro average runs over the classes that occur in the gold labels or the predictions, like seqeval and
+    scikit-learn.
+    """
+    tp, fp, fn = counts[..., TP], counts[..., FP], counts[..., FN]
+    micro_denominator = 2 * tp.sum(-1) + fp.sum(-1) + fn.sum(-1)
+    micro = np.divide(2 * tp.sum(-1), micro_denominator, out=np.zeros_like(micro_denominator),
+                      where=micro_denominator > 0)
+    denominator = 2 * tp + fp + fn
+    per_class = np.divide(2 * tp, denominator, out=np.full_like(denominator, np.nan), where=denominator > 0)
+    present = denominator > 0
+    macro = np.divide(np.nansum(per_class, axis=-1), present.sum(-1), out=np.zeros_like(micro),
+                      where=present.any(-1))
+    return micro, macro
+
+
+def bootstrap_scores(counts, n_resamples=10000, seed=42, batch_size=1000):
+    """
+    Micro and macro F1 of every model on the same `n_resamples` bootstrap resamples.
+
+    `counts` has shape `(models, examples, classes, 3)`. Each batch of resamples is one multinomial weight matrix
+    multiplied with the counts of all models at once. Returns two arrays of shape `(models, n_resamples)`.
+    """
+    n_models, n_examples, n_classes, _ = counts.shape
+    flat = counts.transpose(1, 0, 2, 3).reshape(n_examples, -1)
+    rng = np.random.default_rng(seed)
+    micro = np.empty((n_models, n_resamples))
+    macro = np.empty((n_models, n_resamples))
+    for start in range(0, n_resamples, batch_size):
+        size = min(batch_size, n_resamples - start)
+        weights = rng.multinomial(n_examples, np.full(n_examples, 1 / n_examples), size=size).astype(float)
+        resampled = (weights @ flat).reshape(size, n_models, n_classes, 3)
+        batch_micro, batch_macro = f1_scores(resampled)
+        micro[:, start:start + size] = batch_micro.T
+        macro[:, start:start + size] = batch_macro.T
+    return micro, macro
+
+
+def prediction_file(trials_dir, trial_id, task):
+    return os.path.join(trials_dir, str(trial_id), "predictions.txt" if task == "ner" else "predict_results.txt")
+
+
+def bootstrap_ci(base_dir, metric, gold, task=None, trials_dir=None, n_resamples=10000, confidence=0.95, seed=42,
+                 batch_size=1000, print_results=False, formats=()):
+    """
+    Confidence intervals of the micro/macro F1 of every best trial and paired tests between the models of a dataset.
+
+    `gold` maps dataset names to gold label files or datasets (see `read_gold`). Returns the confidence interval
+    and comparison tables.
+    """
+    task = task or ("ner" if "ner" in base_dir else "cls")
+    trials_dir = trials_dir or os.path.join(base_dir, "trials")
+    read_predictions = read_ner_predictions if task == "ner" else read_cls_predictions
+    best_rows = select_best(load_results(base_dir, columns=[metric, "trialJobId"]), metric)
+    alpha = (1 - confidence) / 2
+
+    intervals = []
+    comparisons = []
+    for dataset_name, models in best_rows.groupby("dataset_name", sort=False):
+        if dataset_name not in gold:
+            print(f"No gold labels for dataset {dataset_name}. Skipping...")
+            continue
+        gold_labels = read_gold(gold[dataset_name], task)
+
+        model_names = []
+        model_predictions = []
+        for model_name, trial_id in zip(models["model_name"], models["trialJobId"]):
+            path = prediction_file(trials_dir, trial_id, task)
+            if not os.path.exists(path):
+                print(f"No predictions for {model_name} on {dataset_name} ({path}). Skipping...")
+                continue
+            predictions = read_predictions(path)
+            if len(predictions) != len(gold_labels):
+                print(f"{path} has {len(predictions)} examples, the gold labels have {len(gold_labels)}. Skipping...")
+                continue
+            model_names.append(model_name)
+            model_predictions.append(predictions)
+        if not model_names:
+            continue
+
+        # Score every model against the same class list so the counts can be stacked
+        if task == "ner":
+            # Words beyond max_seq_length have no prediction and are not scored in run_ner.py either
+            per_model = [ner_counts([tags[:len(predicted)] for tags, predicted in zip(gold_labels, predictions)],
+                                    predictions) for predictions in model_predictions]
+        else:
+            per_model = [cls_counts(gold_labels, predictions) for predictions in model_predictions]
+        classes = sorted(set().union(*(model_classes for _, model_classes in per_model)))
+        counts = np.zeros((len(model_names), len(gold_labels), len(classes), 3))
+        for i, (model_counts, model_classes) in enumerate(per_model):
+            counts[i][:, [classes.index(label) for label in model_classes]] = model_counts
+
+        estimates = dict(zip(["micro_f1", "macro_f1"], f1_scores(counts.sum(axis=1))))
+        resamples = dict(zip(["micro_f1", "macro_f1"], bootstrap_scores(counts, n_resamples, seed, batch_size)))
+
+        for score_name in ["micro_f1", "macro_f1"]:
+            low, high = np.quantile(resamples[score_name], [alpha, 1 - alpha], axis=1)
+            for i, model_name in enumerate(model_names):
+                intervals.append({
+                    "model_name": model_name,
+                    "dataset_name": dataset_name,
+                    "metric": f"predict_{score_name}",
+                    "estimate": estimates[score_name][i],
+                    "ci_low": low[i],
+                    "ci_high": high[i],
+                })
+            for i, j in combinations(range(len(model_names)), 2):
+                delta = estimates[score_name][i] - estimates[score_name][j]
+                deltas = resamples[score_name][i] - resamples[score_name][j]
+                # Two-sided test of the shifted bootstrap distribution of the difference
+                p_value = (1 + np.sum(np.abs(deltas - delta) >= abs(delta))) / (n_resamples + 1)
+                comparisons.append({
+                    "dataset_name": dataset_name,
+                    "model_a": model_names[i],
+                    "model_b": model_names[j],
+                    "metric": f"predict_{score_name}",
+                    "delta": delta,
+                    "ci_low": np.quantile(deltas, alpha),
+                    "ci_high": np.quantile(deltas, 1 - alpha),
+                    "p_value": p_value,
+                })
+
+    intervals = pd.DataFrame(intervals)
+    comparisons = pd.DataFrame(comparisons)
+
+    # Save results to CSV files or print them
+    if print_results:
+        for result in intervals.to_dict("records"):
+            print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, {result['metric']}: "
+                  f"{result['estimate']:.4f} [{result['ci_low']:.4f}, {result['ci_high']:.4f}]")
+        for result in comparisons.to_dict("records"):
+            print(f"Dataset: {result['dataset_name']}, {result['model_a']} - {result['model_b']}, "
+                  f"{result['metric']}: {result['delta']:+.4f} [{result['ci_low']:+.4f}, {result['ci_high']:+.4f}], "
+                  f"p = {result['p_value']:.4f}")
+        print(f"Total comparisons: {len(comparisons)}")
+    else:
+        # Ensure the 'csv' directory exists
+        output_dir = os.path.join(base_dir, "csv")
+        os.makedirs(output_dir, exist_ok=True)
+
+        output_file = os.path.join(output_dir, "bootstrap_ci.csv")
+        write_table(intervals, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+        output_file = os.path.join(output_dir, "bootstrap_comparisons.csv")
+        write_table(comparisons, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+    return intervals, comparisons
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals and paired tests of the best trials.")
+    parser.add_argument("base_dir", type=str, help="Path to the task directory (containing experiments/ and trials/).")
+    parser.add_argument("--gold", type=str, nargs="+", required=True, metavar="DATASET=PATH",
+                        help="Gold labels of the test split of each dataset: a file in the format of the predictions, "
+                             "a save_to_disk dataset directory (as in create_hpsets_configs.py) or a dataset loadable "
+                             "with datasets.load_dataset.")
+    parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric used to select the best trials.")
+    parser.add_argument("--task", type=str, choices=["ner", "cls"], default=None,
+                        help="Task of the experiments (default: ner if 'ner' is in base_dir, else cls).")
+    parser.add_argument("--trials_dir", type=str, default=None,
+                        help="Directory with the trial outputs (default: base_dir/trials).")
+    parser.add_argument("--resamples", type=int, default=10000, help="Number of bootstrap resamples.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the resampling.")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of resamples computed at once.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
+    parser.add_argument("--print", action="store_true", help="Print the results instead of saving to CSV files.")
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+    gold = {dataset_name: os.path.expanduser(path) for dataset_name, path in
+            (entry.split("=", 1) for entry in args.gold)}
+    trials_dir = os.path.abspath(os.path.expanduser(args.trials_dir)) if args.trials_dir else None
+    bootstrap_ci(base_dir, args.metric, gold, task=args.task, trials_dir=trials_dir, n_resamples=args.resamples,
+                 confidence=args.confidence, seed=args.seed, batch_size=args.batch_size, print_results=args.print,
+                 formats=args.formats)
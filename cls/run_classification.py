@@ -16,9 +16,16 @@
 """ Finetuning the library models for text classification."""
 # You can also adapt this script on your own text classification task. Pointers for this are left as comments.
 
+import gzip
+import hashlib
+import io
+import json
 import logging
+import math
 import os
+import shutil
 import random
+import signal
 import sys
 import warnings
 from dataclasses import dataclass, field
@@ -49,6 +56,12 @@ from transformers.trainer_utils import get_last_checkpoint
 from transformers.utils import check_min_version, send_example_telemetry
 from transformers.utils.versions import require_version
 
+try:
+    # Only needed to replay cached trials whose logs archive_logs.py compressed with zstd
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 # Will error if the minimal version of Transformers is not installed. Remove at your own risks.
 check_min_version("4.34.0")
@@ -155,6 +168,15 @@ class DataTrainingArguments:
     shuffle_seed: int = field(
         default=42, metadata={"help": "Random seed that will be used to shuffle the train dataset."}
     )
+    train_fraction: Optional[float] = field(
+        default=None,
+        metadata={
+            "help": (
+                "Train on a stratified random subset with this fraction of the training examples (multi-fidelity "
+                "search, set from the tuner's TRIAL_BUDGET)."
+            )
+        },
+    )
     max_train_samples: Optional[int] = field(
         default=None,
         metadata={
@@ -274,22 +296,169 @@ def get_label_list(raw_dataset, split="train") -> List[str]:
     label_list = [str(label) for label in label_list]
     return label_list
 
+def stratified_subset(strata, fraction, seed):
+    '''
+    Indices of a random subset with `fraction` of the examples of every stratum (at least one example each)
+    '''
+    rng = np.random.default_rng(seed)
+    strata = np.asarray([str(stratum) for stratum in strata])
+    indices = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        size = max(1, int(round(fraction * len(members))))
+        indices.append(rng.choice(members, size=size, replace=False))
+    return np.sort(np.concatenate(indices))
+
 class SendMetrics(TrainerCallback):
     '''
-    transformers callback to send metrics to NNI framework
+    transformers callback to send metrics to NNI framework (and keep them for the trial cache)
     '''
+    def __init__(self):
+        self.intermediate_results = []
+        self.final_result = None
     def on_evaluate(self, args, state, control, metrics, **kwargs):
         '''
         Run on end of each epoch
         '''
+        self.intermediate_results.append(metrics['eval_macro_f1'])
         nni.report_intermediate_result(metrics['eval_macro_f1'])
     def on_predict(self, args, state, control, metrics, **kwargs):
         '''
         Run on end of prediction
         '''
+        self.final_result = metrics['predict_macro_f1']
         nni.report_final_result(metrics['predict_macro_f1'])
 
-def main(model_args, data_args, training_args):
+# Results of finished trials by fingerprint (in the trial code directory, next to trials/). A relaunched sweep
+# reports them to NNI instead of training the same configuration again; delete the directory to retrain everything.
+TRIAL_CACHE_DIR = "trial_cache"
+PREDICTIONS_FILE = "predict_results.txt"
+# Start of the final metric sections of a log, the part of a cached trial's log that is replayed
+FINAL_SECTION_MARKER = "***** train metrics *****"
+
+def trial_fingerprint(tuner_params):
+    '''
+    Fingerprint of the effective trial parameters (without the trial's own output directory), the code of this script
+    and the transformers version
+    '''
+    params = {key: value for key, value in tuner_params.items() if key != "output_dir"}
+    with open(os.path.abspath(__file__), "rb") as f:
+        code_version = hashlib.sha256(f.read()).hexdigest()
+    payload = json.dumps({"params": params, "code": code_version, "transformers": transformers.__version__},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_cached_trial(fingerprint):
+    '''
+    Cached results of a finished trial with this fingerprint, or None
+    '''
+    try:
+        with open(os.path.join(TRIAL_CACHE_DIR, f"{fingerprint}.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached_trial(fingerprint, entry):
+    '''
+    Store the results of a finished trial, written atomically so concurrent trials never read a partial entry
+    '''
+    os.makedirs(TRIAL_CACHE_DIR, exist_ok=True)
+    cache_file = os.path.join(TRIAL_CACHE_DIR, f"{fingerprint}.json")
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(entry, f, indent=4)
+    os.replace(tmp_file, cache_file)
+
+def replay_cached_trial(entry, output_dir):
+    '''
+    Report the cached results to NNI. The hyperparameter lines and the final metric sections of the cached trial's log
+    are echoed, followed by a `replayed_from=<trial_id>` line, and its predictions are copied, so the parse scripts see
+    the metrics of this trial but do not count the runtimes of the cached one again.
+    '''
+    logger.info(f"Found the results of finished trial {entry['trial_id']}, skipping training")
+    trial_log = entry.get("trial_log")
+    # archive_logs.py may have compressed the log of the cached trial since
+    paths = [trial_log, f"{trial_log}.gz", f"{trial_log}.zst"] if trial_log else []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        if path.endswith(".zst") and zstandard is None:
+            logger.warning(f"Cannot echo the log of trial {entry['trial_id']}: reading {path} requires the "
+                           f"zstandard package (pip install zstandard)")
+            break
+        if path.endswith(".zst"):
+            f = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                 errors="replace")
+        else:
+            f = (gzip.open if path.endswith(".gz") else open)(path, "rt", errors="replace")
+        with f:
+            tail = []
+            for line in f:
+                if line.startswith(FINAL_SECTION_MARKER):
+                    tail = [line]
+                elif tail:
+                    tail.append(line)
+                elif line.startswith(("learning_rate=", "per_device_train_batch_size=")):
+                    sys.stdout.write(line)
+        sys.stdout.writelines(tail)
+        print(f"replayed_from={entry['trial_id']}")
+        sys.stdout.flush()
+        break
+    else:
+        logger.warning(f"No log of trial {entry['trial_id']} found (tried {', '.join(paths) or 'none recorded'}), "
+                       f"its metrics will be missing from this trial's log")
+    predictions_file = os.path.join(entry["output_dir"], PREDICTIONS_FILE)
+    if os.path.exists(predictions_file):
+        shutil.copy(predictions_file, os.path.join(output_dir, PREDICTIONS_FILE))
+    for result in entry["intermediate_results"]:
+        nni.report_intermediate_result(result)
+    nni.report_final_result(entry["final_result"])
+
+def trial_parameters():
+    '''
+    Parameters and id of this trial: from NNI, or from the CAMPAIGN_PARAMETERS file and CAMPAIGN_TRIAL_ID when the
+    trial was started by launch_campaign.py
+    '''
+    if "CAMPAIGN_PARAMETERS" in os.environ:
+        with open(os.environ["CAMPAIGN_PARAMETERS"], "r") as f:
+            return json.load(f)["parameters"], os.environ["CAMPAIGN_TRIAL_ID"]
+    return nni.get_next_parameter(), str(nni.get_trial_id())
+
+class StopOnSignal(TrainerCallback):
+    '''
+    transformers callback that ends training once NNI stops the trial (assessor early stop or experiment stop),
+    which the local training service signals with SIGTERM
+    '''
+    def __init__(self):
+        self.received = False
+        signal.signal(signal.SIGTERM, self.handle)
+    def handle(self, signum, frame):
+        logger.warning("Received SIGTERM, stopping the trial after the current step")
+        self.received = True
+    def on_step_end(self, args, state, control, **kwargs):
+        '''
+        Run on end of each training step
+        '''
+        if self.received:
+            control.should_training_stop = True
+            control.should_evaluate = False
+            control.should_save = False
+    def on_prediction_step(self, args, state, control, **kwargs):
+        '''
+        Run after each evaluation or prediction step, so that a trial stopped during the final evaluation or prediction
+        does not run to completion
+        '''
+        self.exit_if_received()
+    def exit_if_received(self):
+        '''
+        Exit like a process killed by SIGTERM once the trial was stopped, so that launch_campaign.py does not count the
+        trial as finished
+        '''
+        if self.received:
+            logger.info("Trial stopped early, skipping the remaining evaluation and prediction")
+            sys.exit(128 + signal.SIGTERM)
+
+def main(model_args, data_args, training_args, fingerprint=None):
     
     if (
         os.path.exists(training_args.output_dir)
@@ -599,6 +768,11 @@ def main(model_args, data_args, training_args):
         if data_args.shuffle_train_dataset:
             logger.info("Shuffling the training dataset")
             train_dataset = train_dataset.shuffle(seed=data_args.shuffle_seed)
+        if data_args.train_fraction is not None and data_args.train_fraction < 1:
+            # Stratified by label so that rare classes keep their share (not for regression targets)
+            strata = [0] * len(train_dataset) if is_regression else train_dataset["label"]
+            train_dataset = train_dataset.select(stratified_subset(strata, data_args.train_fraction, training_args.seed))
+            logger.info(f"Training on {len(train_dataset)} examples (train_fraction={data_args.train_fraction})")
         if data_args.max_train_samples is not None:
             max_train_samples = min(len(train_dataset), data_args.max_train_samples)
             train_dataset = train_dataset.select(range(max_train_samples))
@@ -704,6 +878,8 @@ def main(model_args, data_args, training_args):
         data_collator = None
 
     # Initialize our Trainer
+    send_metrics = SendMetrics()
+    stop_on_signal = StopOnSignal()
     trainer = Trainer(
         model=model,
         args=training_args,
@@ -712,7 +888,7 @@ def main(model_args, data_args, training_args):
         compute_metrics=compute_metrics,
         tokenizer=tokenizer,
         data_collator=data_collator,
-        callbacks=[SendMetrics()],
+        callbacks=[send_metrics, stop_on_signal],
     )
 
     # Training
@@ -723,11 +899,16 @@ def main(model_args, data_args, training_args):
         elif last_checkpoint is not None:
             checkpoint = last_checkpoint
         train_result = trainer.train(resume_from_checkpoint=checkpoint)
+        # Stopped early, the remaining evaluation and prediction would only delay the next trial
+        stop_on_signal.exit_if_received()
         metrics = train_result.metrics
         max_train_samples = (
             data_args.max_train_samples if data_args.max_train_samples is not None else len(train_dataset)
         )
         metrics["train_samples"] = min(max_train_samples, len(train_dataset))
+        if data_args.train_fraction is not None:
+            # Fidelity of the trial, parsed into results.csv by trial_scanner.py
+            metrics["train_fraction"] = data_args.train_fraction
         trainer.save_model()  # Saves the tokenizer too for easy upload
         trainer.log_metrics("train", metrics)
         trainer.save_metrics("train", metrics)
@@ -742,6 +923,8 @@ def main(model_args, data_args, training_args):
         trainer.log_metrics("eval", metrics)
         trainer.save_metrics("eval", metrics)
 
+    # A SIGTERM between the evaluation and prediction loops
+    stop_on_signal.exit_if_received()
     if training_args.do_predict:
         logger.info("*** Predict ***")
         predictions, _, metrics = trainer.predict(predict_dataset, metric_key_prefix="predict")
@@ -781,6 +964,17 @@ def main(model_args, data_args, training_args):
     else:
         trainer.create_model_card(**kwargs)
 
+    if fingerprint is not None and send_metrics.final_result is not None and trainer.is_world_process_zero():
+        save_cached_trial(fingerprint, {
+            "trial_id": os.path.basename(os.path.normpath(training_args.output_dir)),
+            "output_dir": os.path.abspath(training_args.output_dir),
+            # NNI_OUTPUT_DIR is the trial's directory in the NNI experiment, where NNI writes trial.log
+            "trial_log": (os.path.join(os.environ["NNI_OUTPUT_DIR"], "trial.log")
+                          if "NNI_OUTPUT_DIR" in os.environ else None),
+            "intermediate_results": send_metrics.intermediate_results,
+            "final_result": send_metrics.final_result,
+        })
+
 # TrainingArguments
 default_training_args = {
     "do_eval": True,
@@ -804,12 +998,23 @@ if __name__ == "__main__":
     try:
         print("***** Task starting *****")
         parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments))
-        tuner_params = nni.get_next_parameter()
-        trial_dir = os.path.join("trials", str(nni.get_trial_id()))
+        tuner_params, trial_id = trial_parameters()
+        trial_dir = os.path.join("trials", trial_id)
         if not os.path.exists(trial_dir):
             os.makedirs(trial_dir)
         tuner_params["output_dir"] = trial_dir
+        # Hyperband passes the number of epochs the trial may train as TRIAL_BUDGET, which overrides the default.
+        # With BOHB (multi-fidelity mode, MAX_BUDGET in the search space) the budget is the fidelity instead: the
+        # trial trains on that fraction of the training set, for sqrt(fraction) of the epochs.
+        trial_budget = tuner_params.pop("TRIAL_BUDGET", None)
+        max_budget = tuner_params.pop("MAX_BUDGET", None)
         tuner_params = tuner_params | default_training_args
+        if trial_budget is not None and max_budget is not None:
+            train_fraction = min(1.0, trial_budget / max_budget)
+            tuner_params["train_fraction"] = train_fraction
+            tuner_params["num_train_epochs"] = math.ceil(tuner_params["num_train_epochs"] * math.sqrt(train_fraction))
+        elif trial_budget is not None:
+            tuner_params["num_train_epochs"] = math.ceil(trial_budget)
         logger.debug(tuner_params)
 
         print("*****Got tuning parameters from nni *****")
@@ -817,7 +1022,12 @@ if __name__ == "__main__":
         model_args, data_args, training_args = parser.parse_dict(tuner_params)
         print("***** Parsed tuning parameter from nni *****")
 
-        main(model_args, data_args, training_args)
+        fingerprint = trial_fingerprint(tuner_params)
+        cached_trial = load_cached_trial(fingerprint)
+        if cached_trial is not None:
+            replay_cached_trial(cached_trial, trial_dir)
+        else:
+            main(model_args, data_args, training_args, fingerprint=fingerprint)
     except Exception as exception:
         logger.exception(exception)
         raise
@@ -0,0 +1,149 @@
+"""
+Compare the runtimes and throughput of two sweeps, e.g. before and after a transformers/torch upgrade.
+
+Both sides are either a task directory (its `csv/trial_runtimes.csv` written by parse_runtime.py, or a fresh scan of
+its trial logs if an NNI directory is given) or a runtime table file (CSV, Parquet or Feather). Trials are matched by
+model, dataset, learning rate and batch size; repeated trials of the same configuration are reduced to their median.
+
+Per configuration and per metric the ratio candidate / baseline is reported. The aggregate change of a metric is the
+geometric mean of its ratios, so every configuration counts the same no matter how long it runs. The exit code is 1
+if any aggregate runtime grew (or throughput dropped) by more than `--threshold`, so the script can guard upgrades.
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from results_io import COLUMNAR_FORMATS, read_table, write_table
+from trial_scanner import highest_fidelity, runtime_table, scan_trials, trials_to_frame
+
+CONFIG_KEYS = ["model_name", "dataset_name", "learning_rate", "batch_size"]
+# Lower is better for runtimes, higher is better for throughput
+RUNTIME_METRICS = ["train_runtime", "predict_runtime", "trial_runtime"]
+THROUGHPUT_METRICS = ["train_samples_per_second", "predict_samples_per_second"]
+
+
+def load_runtimes(path, nni_dir=None, workers=1):
+    """Per-trial runtime table of a task directory or a runtime table file, None if there is none."""
+    if not os.path.isdir(path):
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        if path.endswith(".feather"):
+            return pd.read_feather(path)
+        return pd.read_csv(path) if os.path.exists(path) else None
+    if nni_dir is not None:
+        scanned = scan_trials(path, nni_dir, workers=workers)
+        trials = trials_to_frame([record for _, records in scanned for record in records])
+        return runtime_table(trials) if not trials.empty else None
+    return read_table(os.path.join(path, "csv", "trial_runtimes.csv"))
+
+
+def config_medians(trial_runtimes):
+    """Median runtimes and throughput of every configuration, from the trials at each experiment's highest fidelity."""
+    trial_runtimes = highest_fidelity(trial_runtimes)
+    metrics = [metric for metric in RUNTIME_METRICS + THROUGHPUT_METRICS if metric in trial_runtimes]
+    # Rounded so that e.g. 5e-05 and 5.0000000000000002e-05 from different parsers still match
+    trial_runtimes = trial_runtimes.assign(learning_rate=trial_runtimes["learning_rate"].round(12))
+    grouped = trial_runtimes.groupby(CONFIG_KEYS)
+    medians = grouped[metrics].median().round(3)
+    medians["trials"] = grouped.size()
+    return medians.reset_index()
+
+
+def compare_runtimes(baseline, candidate, threshold=0.05):
+    """
+    Per-configuration ratios of two runtime tables and the aggregate (geometric mean) change of every metric.
+
+    A metric regresses if its runtime ratio exceeds `1 + threshold`, or its throughput ratio is below `1 - threshold`.
+    """
+    merged = config_medians(baseline).merge(config_medians(candidate), on=CONFIG_KEYS,
+                                            suffixes=("_baseline", "_candidate"))
+    comparison = merged[CONFIG_KEYS].copy()
+    summary = []
+    for metric in RUNTIME_METRICS + THROUGHPUT_METRICS:
+        if f"{metric}_baseline" not in merged or f"{metric}_candidate" not in merged:
+            continue
+        ratio = merged[f"{metric}_candidate"] / merged[f"{metric}_baseline"]
+        ratio = ratio.where(np.isfinite(ratio) & (ratio > 0))
+        comparison[f"{metric}_baseline"] = merged[f"{metric}_baseline"]
+        comparison[f"{metric}_candidate"] = merged[f"{metric}_candidate"]
+        comparison[f"{metric}_change"] = (ratio - 1).round(4)
+
+        valid = ratio.dropna()
+        if valid.empty:
+            continue
+        aggregate = float(np.exp(np.log(valid).mean()))
+        slower = metric in RUNTIME_METRICS
+        regressed = aggregate > 1 + threshold if slower else aggregate < 1 - threshold
+        comparison[f"{metric}_regressed"] = ratio > 1 + threshold if slower else ratio < 1 - threshold
+        summary.append({
+            "metric": metric,
+            "configs": len(valid),
+            "change": round(aggregate - 1, 4),
+            "regressed_configs": int(comparison[f"{metric}_regressed"].sum()),
+            "regressed": regressed,
+        })
+    comparison["trials_baseline"] = merged["trials_baseline"]
+    comparison["trials_candidate"] = merged["trials_candidate"]
+    return comparison, pd.DataFrame(summary, columns=["metric", "configs", "change", "regressed_configs", "regressed"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the runtimes and throughput of two sweeps.")
+    parser.add_argument("baseline", type=str, help="Task directory or runtime table (e.g. csv/trial_runtimes.csv) "
+                                                   "of the reference sweep.")
+    parser.add_argument("candidate", type=str, help="Task directory or runtime table of the sweep to check.")
+    parser.add_argument("--baseline_nni_dir", type=str, default=None,
+                        help="Scan the baseline's trial logs in this NNI directory instead of reading its runtime table.")
+    parser.add_argument("--candidate_nni_dir", type=str, default=None,
+                        help="Scan the candidate's trial logs in this NNI directory instead of reading its runtime table.")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="Relative slowdown of an aggregate metric that fails the comparison (default: 0.05).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Per-configuration comparison table (default: runtime_comparison.csv in the candidate's "
+                             "csv directory).")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the table as Parquet and/or Feather files next to the CSV file.")
+    parser.add_argument("--print", action="store_true", help="Print the per-configuration changes.")
+    args = parser.parse_args()
+
+    tables = []
+    for path, nni_dir in [(args.baseline, args.baseline_nni_dir), (args.candidate, args.candidate_nni_dir)]:
+        path = os.path.abspath(os.path.expanduser(path))
+        table = load_runtimes(path, os.path.abspath(os.path.expanduser(nni_dir)) if nni_dir else None,
+                              workers=args.workers)
+        if table is None or table.empty:
+            print(f"No trial runtimes found in {path}.")
+            sys.exit(2)
+        tables.append(table)
+
+    comparison, summary = compare_runtimes(*tables, threshold=args.threshold)
+    if comparison.empty:
+        print("No matching configurations (model, dataset, learning rate, batch size) found.")
+        sys.exit(2)
+
+    if args.print:
+        for result in comparison.to_dict("records"):
+            changes = ", ".join(f"{metric}: {result[f'{metric}_change']:+.1%}" for metric in summary["metric"])
+            print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, "
+                  f"Learning Rate: {result['learning_rate']}, Batch Size: {result['batch_size']}, {changes}")
+    else:
+        candidate = os.path.abspath(os.path.expanduser(args.candidate))
+        output_file = args.output or (os.path.join(candidate, "csv", "runtime_comparison.csv")
+                                      if os.path.isdir(candidate)
+                                      else os.path.join(os.path.dirname(candidate), "runtime_comparison.csv"))
+        output_file = os.path.abspath(os.path.expanduser(output_file))
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        write_table(comparison, output_file, args.formats)
+        print(f"Results saved to {output_file}")
+
+    print(f"Matched configurations: {len(comparison)} (threshold: {args.threshold:.1%})")
+    for result in summary.to_dict("records"):
+        print(f"{result['metric']}: {result['change']:+.1%} over {result['configs']} configurations, "
+              f"{result['regressed_configs']} above the threshold{' -> REGRESSION' if result['regressed'] else ''}")
+    regressed = summary["regressed"].any()
+    print("FAIL" if regressed else "PASS")
+    sys.exit(1 if regressed else 0)
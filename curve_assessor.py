@@ -0,0 +1,108 @@
+"""
+NNI assessor that stops trials whose extrapolated learning curve cannot beat the best trial so far.
+
+The run scripts report the eval F1 of every epoch (`SendMetrics.on_evaluate`). Each time a trial reports, the curves of
+all running trials are fitted at once with the saturating power law `y(t) = c - a * t^(-alpha)`: for a fixed grid of
+exponents the fit is linear in `c` and `a`, so one batch of masked least-squares sums covers every trial and exponent,
+and the exponent with the smallest residual wins per trial. A trial is stopped once its best reachable score (the
+larger of its best epoch so far and the extrapolated score at `epoch_num`, since load_best_model_at_end keeps the
+best checkpoint) falls below `threshold` times the best score any trial has reached.
+
+Used through `create_hpsets_configs.py --mode assessor --assessor CurveAssessor`.
+"""
+import logging
+
+import numpy as np
+from nni.assessor import Assessor, AssessResult
+
+logger = logging.getLogger(__name__)
+
+# Exponents of the power law tried for every curve
+ALPHAS = np.array([0.25, 0.5, 1.0, 1.5, 2.0, 3.0])
+
+
+def extrapolate_curves(histories, epoch_num, alphas=ALPHAS):
+    """
+    Extrapolated score at `epoch_num` of every curve in `histories` (trials x epochs, NaN after a trial's last epoch).
+
+    Fits `c - a * t^(-alpha)` to every curve for every exponent in `alphas` and keeps the fit with the smallest squared
+    error; all curves and exponents are solved together.
+    """
+    histories = np.asarray(histories, dtype=float)
+    mask = ~np.isnan(histories)
+    values = np.where(mask, histories, 0.0)
+    epochs = np.arange(1, histories.shape[1] + 1)
+    # Regressor of the slope for every exponent (exponents x epochs)
+    x = -(epochs[np.newaxis, :] ** -alphas[:, np.newaxis])
+
+    # Masked sums of the normal equations (trials x exponents)
+    n = mask.sum(axis=1)[:, np.newaxis]
+    sum_x = mask @ x.T
+    sum_xx = mask @ (x ** 2).T
+    sum_y = values.sum(axis=1)[:, np.newaxis]
+    sum_xy = values @ x.T
+    sum_yy = (values ** 2).sum(axis=1)[:, np.newaxis]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+        intercept = (sum_y - slope * sum_x) / n
+    squared_error = (sum_yy - 2 * intercept * sum_y - 2 * slope * sum_xy + n * intercept ** 2
+                     + 2 * intercept * slope * sum_x + slope ** 2 * sum_xx)
+    squared_error = np.where(np.isfinite(squared_error), squared_error, np.inf)
+
+    best = np.argmin(squared_error, axis=1)
+    rows = np.arange(len(histories))
+    predictions = intercept[rows, best] - slope[rows, best] * epoch_num ** -alphas[best]
+    # Curves too short (or flat) to fit predict their last value
+    last = np.take_along_axis(histories, (n[:, 0] - 1).clip(min=0)[:, np.newaxis], axis=1)[:, 0]
+    return np.where(np.isfinite(predictions), predictions, last)
+
+
+class CurveAssessor(Assessor):
+    """
+    Stop trials whose extrapolated best score stays below `threshold` times the best score seen so far.
+
+    `epoch_num` is the number of epochs a trial trains, `start_step` the number of epochs reported before a trial can
+    be stopped.
+    """
+
+    def __init__(self, epoch_num=30, start_step=5, threshold=0.95, optimize_mode="maximize"):
+        if optimize_mode != "maximize":
+            raise ValueError("CurveAssessor only supports optimize_mode: maximize (F1 scores).")
+        self.epoch_num = epoch_num
+        self.start_step = start_step
+        self.threshold = threshold
+        self.running = {}
+        self.predictions = {}
+        self.best_score = None
+
+    def assess_trial(self, trial_job_id, trial_history):
+        history = [float(value) for value in trial_history]
+        self.running[trial_job_id] = history
+        best_so_far = max(history)
+        if self.best_score is None or best_so_far > self.best_score:
+            self.best_score = best_so_far
+        if len(history) < self.start_step:
+            return AssessResult.Good
+
+        # Fit every running trial that reported enough epochs in one batch
+        trial_ids = [trial_id for trial_id, curve in self.running.items() if len(curve) >= self.start_step]
+        length = max(len(self.running[trial_id]) for trial_id in trial_ids)
+        histories = np.full((len(trial_ids), length), np.nan)
+        for row, trial_id in enumerate(trial_ids):
+            histories[row, :len(self.running[trial_id])] = self.running[trial_id]
+        self.predictions.update(zip(trial_ids, extrapolate_curves(histories, self.epoch_num)))
+
+        reachable = max(best_so_far, self.predictions[trial_job_id])
+        if reachable < self.threshold * self.best_score:
+            bar = self.threshold * self.best_score
+            hopeless = sum(1 for trial_id in trial_ids if max(*self.running[trial_id], self.predictions[trial_id]) < bar)
+            logger.info(f"Stopping trial {trial_job_id} after {len(history)} epochs: extrapolated best "
+                        f"{reachable:.4f} < {self.threshold} x best {self.best_score:.4f} "
+                        f"({hopeless} of {len(trial_ids)} running trials are below it)")
+            return AssessResult.Bad
+        return AssessResult.Good
+
+    def trial_end(self, trial_job_id, success):
+        self.running.pop(trial_job_id, None)
+        self.predictions.pop(trial_job_id, None)
@@ -0,0 +1,223 @@
+"""
+Run the trials of all model x dataset experiments from one global queue.
+
+`nnictl create` per experiment leaves GPUs idle between experiments and while the last trials of an experiment drain.
+This launcher expands the grid of every `hpset_<model>_<dataset>.json` below `base_dir`, queues all trials of all
+experiments and starts the next trial as soon as any GPU slot is free. Each trial runs the experiment's
+`trialCommand` in its `trialCodeDirectory` (as NNI would) with CUDA_VISIBLE_DEVICES set to its slot; the run scripts
+read their parameters from CAMPAIGN_PARAMETERS instead of NNI.
+
+Trials are laid out like NNI's local training service: `experiment_id.txt` in the experiment directory and
+`<nni_dir>/<experiment_id>/environments/local-env/trials/<trial_id>/trial.log`, so the parse scripts work unchanged.
+A relaunch reuses the experiment ids and skips the grid points that already finished successfully.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import string
+import argparse
+import itertools
+import subprocess
+
+from trial_scanner import TRIALS_SUBDIR, discover_experiments
+
+CONFIG_FILE = "config.yml"
+PARAMETER_FILE = "parameter.cfg"
+# Exit code and end time of a trial, like NNI's local training service writes them
+STATE_FILE = os.path.join(".nni", "state")
+
+
+def random_id(length, alphabet):
+    return "".join(random.choices(alphabet, k=length))
+
+
+def read_config(config_file):
+    """
+    `key: value` pairs of a config.yml written by create_hpsets_configs.py. Keys of a section are prefixed with it
+    (e.g. `tuner.name`), a section itself maps to an empty value.
+    """
+    config = {}
+    section = None
+    with open(config_file, "r") as f:
+        for line in f:
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            if not line.startswith(" "):
+                section = key.strip()
+                config[section] = value.strip()
+            elif line.startswith("  ") and not line.startswith("   "):
+                config[f"{section}.{key.strip()}"] = value.strip()
+    return config
+
+
+def unsupported_search(config):
+    """Why the launcher cannot run an experiment with this config, or None if it is a plain grid search."""
+    if config.get("tuner.name") != "GridSearch":
+        return f"tuner {config.get('tuner.name') or config.get('tuner.className')} needs NNI"
+    if "assessor" in config:
+        return f"assessor {config.get('assessor.name') or config.get('assessor.className')} needs NNI"
+    return None
+
+
+def grid(hpset):
+    """Every combination of the `choice` values of a search space, in GridSearch order."""
+    for name, space in hpset.items():
+        if space.get("_type") != "choice":
+            raise ValueError(f"Only choice search spaces can be expanded into a grid, {name} is {space.get('_type')}.")
+    names = list(hpset)
+    for values in itertools.product(*(hpset[name]["_value"] for name in names)):
+        yield dict(zip(names, values))
+
+
+def finished_parameters(trials_dir):
+    """Parameters of the trials below `trials_dir` that exited successfully."""
+    finished = []
+    if not os.path.isdir(trials_dir):
+        return finished
+    for trial_id in sorted(os.listdir(trials_dir)):
+        try:
+            with open(os.path.join(trials_dir, trial_id, STATE_FILE), "r") as f:
+                exit_code = int(f.read().split()[0])
+            with open(os.path.join(trials_dir, trial_id, PARAMETER_FILE), "r") as f:
+                parameters = json.load(f)["parameters"]
+        except (OSError, ValueError, KeyError, IndexError):
+            continue
+        if exit_code == 0:
+            finished.append(parameters)
+    return finished
+
+
+def experiment_trials(experiment, nni_dir, write_id=True):
+    """Queue entries `(experiment, trial directory, command, code directory, parameters)` of one experiment."""
+    config = read_config(os.path.join(experiment.path, CONFIG_FILE))
+    code_dir = os.path.normpath(os.path.join(experiment.path, config.get("trialCodeDirectory", ".")))
+    hpset_file = os.path.join(experiment.path, f"hpset_{experiment.model_name}_{experiment.dataset_name}.json")
+    with open(hpset_file, "r") as f:
+        hpset = json.load(f)
+
+    # Reuse the experiment id of an earlier launch so that its finished trials count
+    experiment_id = experiment.experiment_id or random_id(8, string.ascii_lowercase + string.digits)
+    if experiment.experiment_id is None and write_id:
+        with open(os.path.join(experiment.path, "experiment_id.txt"), "w") as f:
+            f.write(experiment_id)
+    trials_dir = os.path.join(nni_dir, experiment_id, TRIALS_SUBDIR)
+    finished = finished_parameters(trials_dir)
+
+    trials = []
+    for parameters in grid(hpset):
+        if parameters in finished:
+            continue
+        trial_dir = os.path.join(trials_dir, random_id(5, string.ascii_letters + string.digits))
+        trials.append((experiment, trial_dir, config["trialCommand"], code_dir, parameters))
+    return trials
+
+
+def start_trial(trial, device, sequence):
+    """Start one queued trial on `device`; returns the process and its open log file."""
+    _, trial_dir, command, code_dir, parameters = trial
+    os.makedirs(os.path.join(trial_dir, ".nni"), exist_ok=True)
+    parameter_file = os.path.join(trial_dir, PARAMETER_FILE)
+    with open(parameter_file, "w") as f:
+        json.dump({"parameter_id": sequence, "parameter_source": "algorithm", "parameters": parameters}, f)
+    env = dict(
+        os.environ,
+        CUDA_VISIBLE_DEVICES=str(device),
+        CAMPAIGN_PARAMETERS=os.path.abspath(parameter_file),
+        CAMPAIGN_TRIAL_ID=os.path.basename(trial_dir),
+        # Where NNI would write trial.log; the run scripts record it in their trial cache
+        NNI_OUTPUT_DIR=os.path.abspath(trial_dir),
+    )
+    log_file = open(os.path.join(trial_dir, "trial.log"), "w")
+    process = subprocess.Popen(command, shell=True, cwd=code_dir, env=env, stdout=log_file,
+                               stderr=subprocess.STDOUT)
+    return process, log_file
+
+
+def finish_trial(trial_dir, exit_code):
+    with open(os.path.join(trial_dir, STATE_FILE), "w") as f:
+        f.write(f"{exit_code} {int(time.time() * 1000)}")
+
+
+def launch_campaign(base_dir, nni_dir, gpus, trials_per_gpu=1, dry_run=False, poll_interval=5):
+    experiments = discover_experiments(base_dir, use_cache=False)
+    experiments = [experiment for experiment in experiments
+                   if os.path.exists(os.path.join(experiment.path, CONFIG_FILE))]
+    # Budgets (Hyperband/BOHB) and early stopping (assessors) come from NNI, these experiments are left to nnictl
+    supported = []
+    for experiment in experiments:
+        reason = unsupported_search(read_config(os.path.join(experiment.path, CONFIG_FILE)))
+        if reason is None:
+            supported.append(experiment)
+        else:
+            print(f"Skipping {experiment.model_name}/{experiment.dataset_name}: {reason}, "
+                  f"run it with nnictl create --config {os.path.join(experiment.path, CONFIG_FILE)}")
+    experiments = supported
+    queue = [trial for experiment in experiments
+             for trial in experiment_trials(experiment, nni_dir, write_id=not dry_run)]
+    print(f"{len(queue)} trials of {len(experiments)} experiments queued on {len(gpus)} GPUs "
+          f"({trials_per_gpu} trials per GPU).")
+    if dry_run:
+        return []
+
+    # One slot per trial a GPU may run at a time; the queue is consumed in order
+    free_slots = [gpu for gpu in gpus for _ in range(trials_per_gpu)]
+    running = {}
+    results = []
+    queue.reverse()
+    try:
+        while queue or running:
+            while queue and free_slots:
+                trial = queue.pop()
+                device = free_slots.pop(0)
+                process, log_file = start_trial(trial, device, len(results) + len(running))
+                running[process] = (trial, device, log_file)
+                experiment = trial[0]
+                print(f"Started {experiment.model_name}/{experiment.dataset_name} trial "
+                      f"{os.path.basename(trial[1])} on GPU {device} ({len(queue)} queued)")
+            time.sleep(poll_interval)
+            for process in [process for process in running if process.poll() is not None]:
+                trial, device, log_file = running.pop(process)
+                log_file.close()
+                finish_trial(trial[1], process.returncode)
+                free_slots.append(device)
+                results.append((trial, process.returncode))
+                if process.returncode != 0:
+                    print(f"Trial {os.path.basename(trial[1])} failed with exit code {process.returncode}, "
+                          f"see {os.path.join(trial[1], 'trial.log')}")
+    except KeyboardInterrupt:
+        # SIGTERM lets the run scripts stop after the current step; unfinished trials are queued again next time
+        print(f"Interrupted, stopping {len(running)} running trials.")
+        for process in running:
+            process.terminate()
+        for process, (trial, _, log_file) in running.items():
+            process.wait()
+            log_file.close()
+            # Never record a terminated trial as successful, whatever its exit code
+            finish_trial(trial[1], process.returncode or -signal.SIGTERM)
+
+    failed = sum(1 for _, exit_code in results if exit_code != 0)
+    print(f"Finished {len(results)} trials, {failed} failed.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the trials of all experiments from one global GPU queue.")
+    parser.add_argument("base_dir", type=str, help="Task directory (cls/ or ner/) or repository root with the "
+                                                   "experiments created by create_hpsets_configs.py.")
+    parser.add_argument("--nni_dir", type=str, default="~/nni-experiments",
+                        help="Directory the trial logs are written to, in NNI's layout.")
+    parser.add_argument("--gpus", type=int, nargs="+", default=[0], help="GPU indices to run trials on.")
+    parser.add_argument("--trials_per_gpu", type=int, default=1, help="Number of trials sharing one GPU.")
+    parser.add_argument("--poll_interval", type=float, default=5, help="Seconds between checks for finished trials.")
+    parser.add_argument("--dry_run", action="store_true", help="Only report how many trials would run.")
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+    nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
+    results = launch_campaign(base_dir, nni_dir, args.gpus, trials_per_gpu=args.trials_per_gpu,
+                              dry_run=args.dry_run, poll_interval=args.poll_interval)
+    sys.exit(1 if any(exit_code != 0 for _, exit_code in results) else 0)
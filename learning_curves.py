@@ -0,0 +1,178 @@
+"""
+Extract the per-epoch learning curves of every trial into a long-format table.
+
+The HF Trainer logs a dict line for every logging step (`{'loss': ..., 'grad_norm': ..., 'learning_rate': ...,
+'epoch': ...}`) and every evaluation (`{'eval_loss': ..., 'eval_micro_f1': ..., 'epoch': 3.0}`). Each value
+becomes one row (experiment_id, model_name, dataset_name, trialJobId, epoch, metric, value) of
+`csv/learning_curves.csv`, which is also stored as Parquet (dictionary-encoded ids, float values) if pyarrow is
+installed. `best_epochs` answers at which epoch each trial reached its best eval score.
+"""
+import io
+import os
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import results_io
+from results_db import upsert_curves
+from results_io import COLUMNAR_FORMATS, read_table, write_table
+from trial_scanner import find_experiments, open_trial_log, plan_experiment
+
+CURVE_COLUMNS = ["experiment_id", "model_name", "dataset_name", "trialJobId", "epoch", "metric", "value"]
+
+# A logged dict (possibly preceded by a progress bar on the same line) and its `'key': value` items
+LOG_DICT_PATTERN = re.compile(r"\{'[^{}]*\}")
+LOG_ITEM_PATTERN = re.compile(r"'([^']+)': ([^,}]+)")
+
+# Per-run summaries and speed measurements are not part of the curves (see parse_runtime.py)
+SKIPPED_SUFFIXES = ("_runtime", "_samples_per_second", "_steps_per_second", "total_flos")
+
+
+def parse_log_dict(line):
+    """Numeric items of the dict logged on `line`, or None if there is none."""
+    match = LOG_DICT_PATTERN.search(line)
+    if match is None:
+        return None
+    values = {}
+    for key, value in LOG_ITEM_PATTERN.findall(match.group()):
+        try:
+            values[key] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def trial_curve(task):
+    """
+    Curve rows of one `(record, trial_log_path)` task. Module level so it can run in a worker process.
+
+    Logging stops at the training summary (the dict with `train_runtime`): the evaluation after training re-scores
+    the best checkpoint (load_best_model_at_end) and is not a point of the curve.
+    """
+    record, trial_log_path = task
+    ids = (record.experiment_id, record.model_name, record.dataset_name, record.trialJobId)
+    rows = []
+    try:
+        with io.TextIOWrapper(open_trial_log(trial_log_path), encoding="utf-8", errors="replace") as trial_log:
+            for line in trial_log:
+                if "{'" not in line:
+                    continue
+                values = parse_log_dict(line)
+                if not values or "epoch" not in values:
+                    continue
+                if "train_runtime" in values:
+                    break
+                epoch = values.pop("epoch")
+                rows.extend((*ids, epoch, key, value) for key, value in values.items()
+                            if not key.endswith(SKIPPED_SUFFIXES))
+    except OSError as e:
+        print(f"Error reading trial log {trial_log_path}: {e}")
+    return rows
+
+
+def extract_learning_curves(base_dir, nni_dir, workers=1):
+    """Long-format learning curves of every trial below `base_dir`."""
+    tasks = [(record, path) for experiment in find_experiments(base_dir)
+             for path, _, record, _, _ in plan_experiment(experiment, nni_dir)]
+    if workers > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            curves = list(executor.map(trial_curve, tasks, chunksize=chunksize))
+    else:
+        curves = [trial_curve(task) for task in tasks]
+    return pd.DataFrame([row for rows in curves for row in rows], columns=CURVE_COLUMNS)
+
+
+def load_learning_curves(base_dir, metrics=None):
+    """Read the stored learning curves, optionally only the rows of the given `metrics`."""
+    curves = read_table(os.path.join(base_dir, "csv", "learning_curves.csv"))
+    if curves is None:
+        return pd.DataFrame(columns=CURVE_COLUMNS)
+    if metrics is not None:
+        curves = curves[curves["metric"].isin(metrics)]
+    return curves
+
+
+def best_epochs(curves, metric="eval_micro_f1"):
+    """
+    Epoch at which every trial reached its best `metric`, next to the number of epochs it trained.
+
+    `epochs_after_best` is what training beyond the best checkpoint cost; the first of several equal scores counts.
+    """
+    scores = curves[curves["metric"] == metric]
+    if scores.empty:
+        print(f"Metric {metric} not found in the learning curves.")
+        return pd.DataFrame()
+    keys = ["experiment_id", "model_name", "dataset_name", "trialJobId"]
+    grouped = scores.groupby(keys, sort=False)
+    best = scores.loc[grouped["value"].idxmax(), [*keys, "epoch", "value"]]
+    best = best.rename(columns={"epoch": "best_epoch", "value": f"best_{metric}"})
+    best = best.merge(grouped["epoch"].max().rename("epochs").reset_index(), on=keys)
+    best["epochs_after_best"] = best["epochs"] - best["best_epoch"]
+    return best.reset_index(drop=True)
+
+
+def learning_curves(base_dir, nni_dir, metric, print_results=False, workers=1, from_store=False, formats=(),
+                    db_path=None, task=None):
+    if from_store:
+        # Only query the stored curves
+        curves = load_learning_curves(base_dir, metrics=[metric])
+    else:
+        curves = extract_learning_curves(base_dir, nni_dir, workers=workers)
+        if db_path is not None:
+            tasks = {experiment.experiment_id: experiment.task for experiment in find_experiments(base_dir)}
+            upsert_curves(db_path, curves.assign(task=curves["experiment_id"].map(tasks)), task=task)
+    trials = best_epochs(curves, metric)
+
+    # Save results to CSV files or print them
+    if print_results:
+        for result in trials.to_dict("records"):
+            print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, Trial: {result['trialJobId']}, "
+                  f"Best Epoch: {result['best_epoch']:g}/{result['epochs']:g}, Best {metric}: {result[f'best_{metric}']}")
+        if not trials.empty:
+            print(f"Median best epoch: {trials['best_epoch'].median():g}, "
+                  f"epochs trained after the best epoch: {trials['epochs_after_best'].sum():g} "
+                  f"of {trials['epochs'].sum():g}")
+    else:
+        # Ensure the 'csv' directory exists
+        output_dir = os.path.join(base_dir, "csv")
+        os.makedirs(output_dir, exist_ok=True)
+
+        if not from_store:
+            output_file = os.path.join(output_dir, "learning_curves.csv")
+            write_table(curves, output_file, formats)
+            print(f"Results saved to {output_file}")
+
+        output_file = os.path.join(output_dir, "best_epochs.csv")
+        write_table(trials, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+    return curves, trials
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract per-epoch learning curves from trial.log files.")
+    parser.add_argument("base_dir", type=str, help="Path to directory to search for experiment ids.")
+    parser.add_argument("--nni_dir", type=str, default="~/nni-experiments", help="Optional path to NNI directory.")
+    parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Eval metric whose best epoch is reported.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--from_store", action="store_true",
+                        help="Query the stored csv/learning_curves table instead of reading the trial logs.")
+    parser.add_argument("--format", type=str, nargs="+", choices=COLUMNAR_FORMATS, dest="formats",
+                        default=["parquet"] if results_io.pa is not None else [],
+                        help="Also write the tables in these columnar formats (default: parquet if pyarrow is installed).")
+    parser.add_argument("--print", action="store_true", help="Print the results instead of saving to CSV files.")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Also store the learning curves in this SQLite results warehouse (see results_db.py).")
+    parser.add_argument("--task", type=str, default=None,
+                        help="Task stored with the experiments in --db (default: the name of the directory that "
+                             "contains each experiments/ directory, e.g. cls or ner).")
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+    nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
+    learning_curves(base_dir, nni_dir, args.metric, print_results=args.print, workers=args.workers,
+                    from_store=args.from_store, formats=args.formats,
+                    db_path=os.path.abspath(os.path.expanduser(args.db)) if args.db else None, task=args.task)
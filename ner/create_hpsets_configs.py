@@ -1,5 +1,40 @@
 import os
+import csv
+import glob
 import json
+import math
+import argparse
+import statistics
+
+parser = argparse.ArgumentParser(description="Create hyperparameter sets and NNI config files.")
+parser.add_argument("--mode", type=str, choices=["grid", "hyperband", "assessor", "bohb"], default="grid",
+                    help="grid: run every combination for all epochs; hyperband: successive halving over the epoch "
+                         "budget (Hyperband tuner); assessor: grid search whose hopeless trials are stopped early; "
+                         "bohb: multi-fidelity search (BOHB tuner) whose early rounds train on stratified subsets "
+                         "of the training set.")
+parser.add_argument("--assessor", type=str, choices=["Medianstop", "Curvefitting", "CurveAssessor"],
+                    default="Medianstop",
+                    help="Assessor used with --mode assessor; CurveAssessor is the project's curve_assessor.py.")
+parser.add_argument("--threshold", type=float, default=0.95,
+                    help="Curvefitting/CurveAssessor: stop trials whose extrapolated score is below this fraction of "
+                         "the best score.")
+parser.add_argument("--max_epochs", type=int, default=30,
+                    help="Epoch budget of the longest trial (Hyperband R, Curvefitting epoch_num).")
+parser.add_argument("--eta", type=int, default=3,
+                    help="Hyperband/BOHB: keep 1/eta of the trials in every round.")
+parser.add_argument("--min_budget", type=int, default=1,
+                    help="BOHB: budget of the first round; trials train on min_budget/max_budget of the training set.")
+parser.add_argument("--max_budget", type=int, default=9, help="BOHB: budget of a trial on the full training set.")
+parser.add_argument("--start_step", type=int, default=5,
+                    help="Assessor: number of epochs a trial always trains before it can be stopped.")
+parser.add_argument("--warm_start", type=str, default=None,
+                    help="Directory with the experiments/ of earlier sweeps. New model/dataset pairs get a grid narrowed "
+                         "around the best hyperparameters of the other models on the dataset and the model on the "
+                         "other datasets.")
+parser.add_argument("--warm_start_width", type=int, default=1,
+                    help="Warm start: number of grid steps kept on each side of the prior best value.")
+parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Warm start: metric the best trials are chosen by.")
+args = parser.parse_args()
 
 # Available GPU devices
 CUDA_VISIBLE_DEVICES = 2
@@ -20,6 +55,44 @@ datasets = {
     "ggponc2": "/dir/to/ggponc2_fine_long"
 }
 
+LEARNING_RATES = [7e-05, 5e-05, 2e-05, 1e-05, 7e-06, 5e-06, 1e-06]
+BATCH_SIZES = [16, 32, 48, 64]
+
+def load_best_trials(results_dir, metric):
+    """
+    (learning_rate, batch_size) of the best trial of every experiment with a results.csv, by (model, dataset). Only
+    trials at the highest train_fraction of an experiment compete (BOHB), as in select_best.
+    """
+    best_trials = {}
+    for results_file in glob.glob(os.path.join(results_dir, "experiments", "*", "*", "results.csv")):
+        model_name, dataset_name = results_file.split(os.sep)[-3:-1]
+        best = None
+        with open(results_file, newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    fidelity = float(row.get("train_fraction") or 1.0)
+                    trial = (1.0 if math.isnan(fidelity) else fidelity, float(row[metric]),
+                             float(row["learning_rate"]), int(float(row["batch_size"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if not math.isnan(trial[1]) and (best is None or trial[:2] > best[:2]):
+                    best = trial
+        if best is not None:
+            best_trials[(model_name, dataset_name)] = best[2:]
+    return best_trials
+
+def narrow(values, best_values, width):
+    """
+    The 2 * width + 1 consecutive grid `values` centred on the median grid position of `best_values` (nearest on a log
+    scale), shifted inwards at the ends of the grid.
+    """
+    positions = [min(range(len(values)), key=lambda i: abs(math.log(values[i] / value))) for value in best_values]
+    centre = round(statistics.median(positions))
+    start = max(0, min(centre - width, len(values) - 2 * width - 1))
+    return values[start:start + 2 * width + 1]
+
+best_trials = load_best_trials(args.warm_start, args.metric) if args.warm_start else {}
+
 # First run: Create hpset JSON files
 for model_name, model_path in models.items():
     for dataset_name, dataset_path in datasets.items():
@@ -28,9 +101,23 @@ for model_name, model_path in models.items():
             "model_name_or_path": {"_type": "choice", "_value": [f"{model_path}"]},
             "dataset_name": {"_type": "choice", "_value": [f"{dataset_path}"]},
             "max_seq_length": {"_type": "choice", "_value": [max_seq_length]},
-            "learning_rate": {"_type": "choice", "_value": [7e-05, 5e-05, 2e-05, 1e-05, 7e-06, 5e-06, 1e-06]},
-            "per_device_train_batch_size": {"_type": "choice", "_value": [16, 32, 48, 64]}
+            "learning_rate": {"_type": "choice", "_value": LEARNING_RATES},
+            "per_device_train_batch_size": {"_type": "choice", "_value": BATCH_SIZES}
         }
+        # Priors for a new pair: the other models on this dataset and this model on the other datasets
+        priors = [best for (prior_model, prior_dataset), best in best_trials.items()
+                  if (prior_model == model_name) != (prior_dataset == dataset_name)]
+        if (model_name, dataset_name) not in best_trials and priors:
+            hpset["learning_rate"]["_value"] = narrow(LEARNING_RATES, [lr for lr, _ in priors], args.warm_start_width)
+            hpset["per_device_train_batch_size"]["_value"] = narrow(
+                BATCH_SIZES, [batch_size for _, batch_size in priors], args.warm_start_width
+            )
+            print(f"Warm start {model_name}/{dataset_name} from {len(priors)} earlier experiments: "
+                  f"learning rates {hpset['learning_rate']['_value']}, "
+                  f"batch sizes {hpset['per_device_train_batch_size']['_value']}")
+        if args.mode == "bohb":
+            # Turns the TRIAL_BUDGET passed by BOHB into the fraction of the training set (see the run scripts)
+            hpset["MAX_BUDGET"] = {"_type": "choice", "_value": [args.max_budget]}
         output_dir = os.path.join("experiments", model_name, dataset_name)
         os.makedirs(output_dir, exist_ok=True)
         output_file = os.path.join(output_dir, f"hpset_{model_name}_{dataset_name}.json")
@@ -39,6 +126,58 @@ for model_name, model_path in models.items():
 
 print("Hyperparameter sets created successfully.")
 
+# Tuner (and assessor) section of the config files
+if args.mode == "hyperband":
+    # Hyperband passes each trial its number of epochs as TRIAL_BUDGET, which the run scripts train for
+    search_config = f"""tuner:
+  name: Hyperband
+  classArgs:
+    optimize_mode: maximize
+    R: {args.max_epochs}
+    eta: {args.eta}"""
+elif args.mode == "bohb":
+    # Fidelity levels min_budget, min_budget * eta, ..., max_budget; only the best 1/eta of each level is promoted
+    search_config = f"""tuner:
+  name: BOHB
+  classArgs:
+    optimize_mode: maximize
+    min_budget: {args.min_budget}
+    max_budget: {args.max_budget}
+    eta: {args.eta}"""
+else:
+    search_config = """tuner:
+  name: GridSearch
+  classArgs:
+    optimize_mode: maximize"""
+if args.mode == "assessor":
+    # Both assessors judge the per-epoch eval scores reported by SendMetrics.on_evaluate
+    if args.assessor == "Medianstop":
+        assessor_args = f"""    optimize_mode: maximize
+    start_step: {args.start_step}"""
+    elif args.assessor == "Curvefitting":
+        assessor_args = f"""    epoch_num: {args.max_epochs}
+    start_step: {args.start_step}
+    threshold: {args.threshold}
+    gap: 1"""
+    else:
+        assessor_args = f"""    epoch_num: {args.max_epochs}
+    start_step: {args.start_step}
+    threshold: {args.threshold}"""
+    if args.assessor == "CurveAssessor":
+        # Customized assessor, loaded from the repository root (relative to experiments/<model>/<dataset>/)
+        search_config += f"""
+assessor:
+  codeDirectory: ../../../../
+  className: curve_assessor.CurveAssessor
+  classArgs:
+{assessor_args}"""
+    else:
+        search_config += f"""
+assessor:
+  name: {args.assessor}
+  classArgs:
+{assessor_args}"""
+
 # Second run: Create config.yml files
 for model_name, model_path in models.items():
     for dataset_name, dataset_path in datasets.items():
@@ -48,10 +187,7 @@ trialCommand: python run_ner.py
 trialCodeDirectory: ../../../
 trialGpuNumber: 1
 trialConcurrency: {CUDA_VISIBLE_DEVICES}
-tuner:
-  name: GridSearch
-  classArgs:
-    optimize_mode: maximize
+{search_config}
 trainingService:
   platform: local
   maxTrialNumberPerGpu: 1
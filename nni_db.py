@@ -0,0 +1,147 @@
+"""
+Read trial parameters and reported results from an NNI experiment database.
+
+NNI keeps every experiment's trial events and metrics in `<nni_dir>/<experiment_id>/db/nni.sqlite`. Reading it takes
+two indexed queries per experiment, needs no log parsing and works while the experiment is still running. It only
+knows the values `SendMetrics` reported, so everything else still comes from the trial logs.
+"""
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.request import pathname2url
+
+from trial_scanner import TrialRecord
+
+# Final states of a trial job, see TrialJobStatus in NNI
+FINAL_STATUSES = {"SUCCEEDED", "FAILED", "USER_CANCELED", "SYS_CANCELED", "EARLY_STOPPED"}
+
+
+@dataclass
+class NNITrial:
+    """
+    A trial as recorded by the NNI manager.
+    """
+
+    trialJobId: str
+    parameters: Dict[str, object] = field(default_factory=dict)
+    status: Optional[str] = None
+    intermediate: List[float] = field(default_factory=list)
+    final: Optional[float] = None
+    start_time: Optional[int] = None
+    end_time: Optional[int] = None
+
+
+def db_path(nni_dir, experiment_id):
+    return os.path.join(nni_dir, experiment_id, "db", "nni.sqlite")
+
+
+def decode_metric(data):
+    """
+    Decode a MetricData value.
+
+    NNI stores the reported value JSON-encoded as a string inside another JSON string; dict metrics carry the
+    value NNI optimizes under "default".
+    """
+    value = data
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            break
+    if isinstance(value, dict):
+        value = value.get("default")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def decode_parameters(data):
+    """Decode the hyperparameters stored with a WAITING event."""
+    try:
+        value = json.loads(data)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, dict) and "parameters" in value:
+        value = value["parameters"]
+    return value if isinstance(value, dict) else {}
+
+
+def read_experiment_db(nni_dir, experiment_id):
+    """
+    Read all trials of an experiment from its NNI database.
+
+    Returns a dict mapping trial job ids to `NNITrial`, or None if the experiment has no database.
+    """
+    path = db_path(nni_dir, experiment_id)
+    if not os.path.exists(path):
+        return None
+
+    # Open read-only so a running NNI manager is never blocked by us
+    connection = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True)
+    try:
+        events = connection.execute(
+            "SELECT trialJobId, event, data, timestamp FROM TrialJobEvent ORDER BY trialJobId, timestamp"
+        ).fetchall()
+        metrics = connection.execute(
+            "SELECT trialJobId, type, data FROM MetricData ORDER BY trialJobId, sequence, timestamp"
+        ).fetchall()
+    finally:
+        connection.close()
+
+    trials = {}
+    for trial_id, event, data, timestamp in events:
+        trial = trials.setdefault(trial_id, NNITrial(trialJobId=trial_id))
+        if event == "WAITING" and data:
+            trial.parameters = decode_parameters(data)
+        elif event == "RUNNING":
+            trial.start_time = timestamp
+        if event in FINAL_STATUSES:
+            trial.end_time = timestamp
+        if event not in ("ADD_HYPERPARAMETER", "ADD_CUSTOMIZED"):
+            trial.status = event
+
+    for trial_id, metric_type, data in metrics:
+        trial = trials.setdefault(trial_id, NNITrial(trialJobId=trial_id))
+        value = decode_metric(data)
+        if value is None:
+            continue
+        if metric_type == "FINAL":
+            trial.final = value
+        else:
+            trial.intermediate.append(value)
+    return trials
+
+
+def merge_db_trials(experiment, records, db_trials):
+    """
+    Combine log records of one experiment with the trials NNI knows about.
+
+    Hyperparameters, status and the reported results (as `nni_final`, `nni_best_intermediate` and
+    `nni_last_intermediate`) come from the database; all other metrics from the logs. Trials that have no log yet
+    are included as well. Returns the records sorted by trial id.
+    """
+    merged = {record.trialJobId: record for record in records}
+    for trial_id, trial in db_trials.items():
+        record = merged.get(trial_id)
+        if record is None:
+            record = merged[trial_id] = TrialRecord(
+                model_name=experiment.model_name,
+                dataset_name=experiment.dataset_name,
+                experiment_id=experiment.experiment_id,
+                trialJobId=trial_id,
+                task=experiment.task
+            )
+        if "learning_rate" in trial.parameters:
+            record.learning_rate = float(trial.parameters["learning_rate"])
+        if "per_device_train_batch_size" in trial.parameters:
+            record.batch_size = int(trial.parameters["per_device_train_batch_size"])
+        record.status = trial.status
+        record.metrics["nni_final"] = trial.final
+        record.metrics["nni_best_intermediate"] = max(trial.intermediate) if trial.intermediate else None
+        record.metrics["nni_last_intermediate"] = trial.intermediate[-1] if trial.intermediate else None
+    return [merged[trial_id] for trial_id in sorted(merged)]
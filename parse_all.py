@@ -0,0 +1,71 @@
+import os
+import argparse
+
+import parse_best_metrics
+import parse_entity_metrics
+from parse_best_hparams import parse_best_hyperparams
+from parse_runtime import parse_runtime
+from parse_throughput import parse_throughput
+from results_db import upsert_trials
+from results_io import COLUMNAR_FORMATS
+from trial_scanner import MANIFEST_FILE, load_results, scan_trials, select_best, trials_to_frame
+
+def build_summaries(base_dir, metric, trials_table, print_results=False, formats=()):
+    """
+    Write every csv/ summary from one in-memory table of trials.
+
+    The best trial of every experiment is selected once and shared by all summaries. Returns the summaries as
+    DataFrames (the entity metrics as a dict of one DataFrame per dataset).
+    """
+    best_rows = select_best(trials_table, metric)
+    summaries = {
+        "best_hyperparams": parse_best_hyperparams(base_dir, metric, print_results=print_results, best_rows=best_rows,
+                                                   formats=formats),
+        "best_metrics": parse_best_metrics.parse_predict_metrics(base_dir, metric, print_results=print_results,
+                                                                  best_rows=best_rows, formats=formats),
+        "entity_metrics": parse_entity_metrics.parse_predict_metrics(base_dir, metric, print_results=print_results,
+                                                                      best_rows=best_rows, formats=formats),
+    }
+    # Runtimes and throughput are only known if the table comes from the trial logs rather than from results.csv
+    if "train_runtime" in trials_table:
+        summaries["best_runtimes"] = parse_runtime(base_dir, metric, None, print_results=print_results,
+                                                   trials_table=trials_table, best_rows=best_rows, formats=formats)
+    if "train_samples_per_second" in trials_table:
+        summaries["throughput"] = parse_throughput(base_dir, None, print_results=print_results,
+                                                   trials_table=trials_table, formats=formats)
+    return summaries
+
+def parse_all(base_dir, metric, nni_dir=None, print_results=False, workers=1, formats=(), db_path=None, task=None):
+    if nni_dir is None:
+        # Load all results.csv files once
+        trials_table = load_results(base_dir)
+    else:
+        # Scan the trial logs once (incrementally, sharing the manifest with parse_results.py)
+        scanned = scan_trials(base_dir, nni_dir, manifest_path=os.path.join(base_dir, MANIFEST_FILE), workers=workers)
+        trials_table = trials_to_frame([record for _, records in scanned for record in records])
+    if db_path is not None:
+        upsert_trials(db_path, trials_table, task=task)
+    return build_summaries(base_dir, metric, trials_table, print_results=print_results, formats=formats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write all csv/ summaries from one pass over the results.")
+    parser.add_argument("base_dir", type=str, help="Path to directory to search for results.csv files.")
+    parser.add_argument("--nni_dir", type=str, default=None,
+                        help="Read the trial logs in this NNI directory instead of results.csv; also writes best_runtimes.csv.")
+    parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric to optimize.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
+    parser.add_argument("--print", action="store_true", help="Print the results instead of saving to CSV files.")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Also store the trials in this SQLite results warehouse (see results_db.py).")
+    parser.add_argument("--task", type=str, default=None,
+                        help="Task stored with the experiments in --db (default: the name of the directory that "
+                             "contains each experiments/ directory, e.g. cls or ner).")
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+    nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir)) if args.nni_dir else None
+    db_path = os.path.abspath(os.path.expanduser(args.db)) if args.db else None
+    parse_all(base_dir, args.metric, nni_dir=nni_dir, print_results=args.print, workers=args.workers,
+              formats=args.formats, db_path=db_path, task=args.task)
@@ -2,43 +2,26 @@ import os
 import pandas as pd
 import argparse
 
-def parse_best_hyperparams(base_dir, metric, print_results=False):
-    results = []
-
-    # Walk through the directory structure
-    for root, _, files in os.walk(base_dir):
-        for file in files:
-            if file == "results.csv":
-                file_path = os.path.join(root, file)
-                if not os.path.exists(file_path):
-                    continue  # Skip if the file does not exist
-
-                try:
-                    # Read the CSV file
-                    df = pd.read_csv(file_path)
-
-                    # Find the row with the highest reward
-                    best_row = df.loc[df[metric].idxmax()]
-
-                    # Extract relevant information
-                    model_name = os.path.basename(os.path.dirname(root))
-                    dataset_name = os.path.basename(root)
-                    learning_rate = best_row['learning_rate']
-                    batch_size = best_row['batch_size']
-
-                    # Append to results
-                    results.append({
-                        "model_name": model_name,
-                        "dataset_name": dataset_name,
-                        "learning_rate": learning_rate,
-                        "batch_size": batch_size
-                    })
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
+from results_io import COLUMNAR_FORMATS, read_table, write_table
+from trial_scanner import experiment_keys, highest_fidelity, load_results, select_best
+
+EXPERIMENT_KEYS = ["model_name", "dataset_name"]
+
+def parse_best_hyperparams(base_dir, metric, print_results=False, results_table=None, best_rows=None, formats=()):
+    # Select the best trial of every experiment with one groupby, unless the caller already did
+    if best_rows is None:
+        # Load all results tables once (only the needed columns) unless the caller already has them in memory
+        if results_table is None:
+            results_table = load_results(base_dir, columns=[metric, "learning_rate", "batch_size"])
+        best_rows = select_best(results_table, metric)
+
+    # Extract relevant information
+    results = best_rows.reindex(columns=["model_name", "dataset_name", "learning_rate", "batch_size"])
+    results = results.reset_index(drop=True)
 
     # Save results to a CSV file or print them
     if print_results:
-        for result in results:
+        for result in results.to_dict("records"):
             print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, "
                   f"Learning Rate: {result['learning_rate']}, Batch Size: {result['batch_size']}")
         print(f"Total experiments: {len(results)}")
@@ -49,15 +32,110 @@ def parse_best_hyperparams(base_dir, metric, print_results=False):
 
         # Save the results to the 'csv' directory
         output_file = os.path.join(output_dir, "best_hyperparams.csv")
-        pd.DataFrame(results).to_csv(output_file, index=False)
+        write_table(results, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+    return results
+
+def load_trial_runtimes(base_dir, cost):
+    """Per-trial `cost` column of csv/trial_runtimes.csv (written by parse_runtime.py)."""
+    runtimes = read_table(os.path.join(base_dir, "csv", "trial_runtimes.csv"),
+                          columns=[*EXPERIMENT_KEYS, "trialJobId", cost])
+    if runtimes is None or cost not in runtimes:
+        print(f"No {cost} in {os.path.join(base_dir, 'csv', 'trial_runtimes.csv')}. Run parse_runtime.py first.")
+        return None
+    return runtimes
+
+def pareto_front(trials, metric, cost):
+    """
+    Trials of every experiment that no other trial beats in both `metric` (higher) and `cost` (lower).
+
+    Sorted by cost, a trial is on the front if it scores higher than every cheaper trial of its experiment.
+    """
+    keys = experiment_keys(trials)
+    trials = trials.sort_values([*keys, cost, metric], ascending=[*(True for _ in keys), True, False])
+    best_so_far = trials.groupby(keys, sort=False, dropna=False)[metric].cummax()
+    previous_best = best_so_far.groupby([trials[key] for key in keys], sort=False, dropna=False).shift()
+    return trials[previous_best.isna() | (trials[metric] > previous_best)]
+
+def cheapest_within(trials, metric, cost, tolerance):
+    """Cheapest trial of every experiment whose `metric` is at most `tolerance` below the experiment's best."""
+    keys = experiment_keys(trials)
+    best = trials.groupby(keys, sort=False, dropna=False)[metric].transform("max")
+    candidates = trials[trials[metric] >= best - tolerance]
+    candidates = candidates.sort_values([*keys, cost, metric], ascending=[*(True for _ in keys), True, False])
+    return candidates.groupby(keys, sort=False, dropna=False).head(1)
+
+def cost_aware_hyperparams(base_dir, metric, tolerance=0.01, cost="trial_runtime", print_results=False,
+                           results_table=None, formats=()):
+    # Load all results tables once unless the caller already has them in memory
+    if results_table is None:
+        results_table = load_results(base_dir, columns=[metric, "trialJobId", "learning_rate", "batch_size"])
+    if metric not in results_table:
+        print(f"Metric {metric} not found in the results.")
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Join the per-trial compute time, unless the table already has it (e.g. from a scan of the trial logs)
+    if cost not in results_table:
+        runtimes = load_trial_runtimes(base_dir, cost)
+        if runtimes is None:
+            return pd.DataFrame(), pd.DataFrame()
+        results_table = results_table.merge(runtimes, on=[*EXPERIMENT_KEYS, "trialJobId"], how="inner")
+    # Like select_best, only trials at an experiment's highest fidelity compete
+    trials = highest_fidelity(results_table.dropna(subset=[metric, cost]))
+    columns = [*EXPERIMENT_KEYS, "trialJobId", "learning_rate", "batch_size", metric, cost]
+
+    front = pareto_front(trials, metric, cost).reindex(columns=columns).reset_index(drop=True)
+    results = cheapest_within(trials, metric, cost, tolerance)
+    keys = experiment_keys(trials)
+    best = select_best(trials, metric)[[*keys, metric, cost]]
+    results = results.merge(best.rename(columns={metric: f"best_{metric}", cost: f"best_{cost}"}), on=keys)
+    results = results.reindex(columns=[*columns, f"best_{metric}", f"best_{cost}"])
+    results["cost_ratio"] = (results[cost] / results[f"best_{cost}"]).round(3)
+    results = results.reset_index(drop=True)
+
+    # Save results to CSV files or print them
+    if print_results:
+        for result in results.to_dict("records"):
+            print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, "
+                  f"Learning Rate: {result['learning_rate']}, Batch Size: {result['batch_size']}, "
+                  f"{metric}: {result[metric]} (best: {result[f'best_{metric}']}), "
+                  f"{cost}: {result[cost]:.1f} ({result['cost_ratio']:.0%} of the best trial)")
+        print(f"Total experiments: {len(results)}, Pareto-optimal trials: {len(front)}")
+    else:
+        # Ensure the 'csv' directory exists
+        output_dir = os.path.join(base_dir, "csv")
+        os.makedirs(output_dir, exist_ok=True)
+
+        output_file = os.path.join(output_dir, "cost_aware_hyperparams.csv")
+        write_table(results, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+        output_file = os.path.join(output_dir, "pareto_front.csv")
+        write_table(front, output_file, formats)
         print(f"Results saved to {output_file}")
 
+    return results, front
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse best hyperparameters from results.csv files.")
     parser.add_argument("base_dir", type=str, help="Path to directory to search for results.csv files.")
     parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric to optimize.")
+    parser.add_argument("--cost_aware", action="store_true",
+                        help="Report the Pareto front of metric and compute time and the cheapest trial within "
+                             "--tolerance of the best (needs csv/trial_runtimes.csv from parse_runtime.py).")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="With --cost_aware, how far (absolute) below the best metric a trial may score.")
+    parser.add_argument("--cost", type=str, default="trial_runtime",
+                        help="With --cost_aware, the per-trial cost column of trial_runtimes.csv.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
     parser.add_argument("--print", action="store_true", help="Print the results instead of saving to a CSV file.")
     args = parser.parse_args()
 
     base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
-    parse_best_hyperparams(base_dir, args.metric, print_results=args.print)
+    if args.cost_aware:
+        cost_aware_hyperparams(base_dir, args.metric, tolerance=args.tolerance, cost=args.cost,
+                               print_results=args.print, formats=args.formats)
+    else:
+        parse_best_hyperparams(base_dir, args.metric, print_results=args.print, formats=args.formats)
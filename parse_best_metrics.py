@@ -1,66 +1,40 @@
 import os
-import pandas as pd
 import argparse
 
-def parse_predict_metrics(base_dir, metric, print_results=False):
-    results = []
+from results_io import COLUMNAR_FORMATS, write_table
+from trial_scanner import load_results, select_best
 
-    # Walk through the directory structure
-    for root, _, files in os.walk(base_dir):
-        for file in files:
-            if file == "results.csv":
-                file_path = os.path.join(root, file)
-                if not os.path.exists(file_path):
-                    continue  # Skip if the file does not exist
-
-                try:
-                    # Read the CSV file
-                    df = pd.read_csv(file_path)
-
-                    # Find the row with the highest reward
-                    best_row = df.loc[df[metric].idxmax()]
-
-                    # Extract relevant information
-                    model_name = os.path.basename(os.path.dirname(root))
-                    dataset_name = os.path.basename(root)
-                    metrics = {
-                        "predict_macro_f1": None,
-                        "predict_macro_precision": None,
-                        "predict_macro_recall": None,
-                        "predict_micro_f1": None,
-                        "predict_micro_precision": None,
-                        "predict_micro_recall": None,
-                        "predict_weighted_f1": None,
-                        "predict_weighted_precision": None,
-                        "predict_weighted_recall": None,
-                    }
-                    # Adjust accuracy metric name based on the task
-                    if "ner" in base_dir:
-                        metrics.update({
-                            "predict_overall_accuracy": None,
-                        })
-                    else:
-                        metrics.update({
-                            "predict_accuracy": None,
-                        })
+def parse_predict_metrics(base_dir, metric, print_results=False, results_table=None, best_rows=None, formats=()):
+    metrics = [
+        "predict_macro_f1",
+        "predict_macro_precision",
+        "predict_macro_recall",
+        "predict_micro_f1",
+        "predict_micro_precision",
+        "predict_micro_recall",
+        "predict_weighted_f1",
+        "predict_weighted_precision",
+        "predict_weighted_recall",
+    ]
+    # Adjust accuracy metric name based on the task
+    if "ner" in base_dir:
+        metrics.append("predict_overall_accuracy")
+    else:
+        metrics.append("predict_accuracy")
 
-                    # Extract metrics from the best row
-                    for key in metrics.keys():
-                        if key in best_row:
-                            metrics[key] = best_row[key]
+    # Select the best trial of every experiment with one groupby, unless the caller already did
+    if best_rows is None:
+        # Load all results tables once (only the needed columns) unless the caller already has them in memory
+        if results_table is None:
+            results_table = load_results(base_dir, columns=[metric, *metrics])
+        best_rows = select_best(results_table, metric)
 
-                    # Append to results
-                    results.append({
-                        "model_name": model_name,
-                        "dataset_name": dataset_name,
-                        **metrics
-                    })
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
+    # Extract metrics from the best rows
+    results = best_rows.reindex(columns=["model_name", "dataset_name", *metrics]).reset_index(drop=True)
 
     # Save results to a CSV file or print them
     if print_results:
-        for result in results:
+        for result in results.to_dict("records"):
             print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, "
                   f"Predict Macro F1: {result['predict_macro_f1']}, "
                   f"Predict Macro Precision: {result['predict_macro_precision']}, "
@@ -80,15 +54,19 @@ def parse_predict_metrics(base_dir, metric, print_results=False):
 
         # Save the results to the 'csv' directory
         output_file = os.path.join(output_dir, "best_metrics.csv")
-        pd.DataFrame(results).to_csv(output_file, index=False)
+        write_table(results, output_file, formats)
         print(f"Results saved to {output_file}")
 
+    return results
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse predict metrics from results.csv files.")
     parser.add_argument("base_dir", type=str, help="Path to directory to search for results.csv files.")
     parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric to optimize.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
     parser.add_argument("--print", action="store_true", help="Print the results instead of saving to a CSV file.")
     args = parser.parse_args()
 
     base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
-    parse_predict_metrics(base_dir, args.metric, print_results=args.print)
+    parse_predict_metrics(base_dir, args.metric, print_results=args.print, formats=args.formats)
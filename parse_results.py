@@ -1,118 +1,141 @@
 import os
-import re
+import json
+import time
 import pandas as pd
 import argparse
-from datetime import timedelta
 
-def parse_results(base_dir, nni_dir):
+from nni_db import merge_db_trials, read_experiment_db
+from parse_all import build_summaries
+from results_db import upsert_trials
+from results_io import COLUMNAR_FORMATS, write_table
+from trial_scanner import MANIFEST_FILE, find_experiments, scan_trials, trials_to_frame
 
-    # Walk through the directory structure
-    for root, _, files in os.walk(base_dir):
-        for file in files:
-            if file == "experiment_id.txt":
-                file_path = os.path.join(root, file)
-                if not os.path.exists(file_path):
-                    print(f"File {file_path} does not exist. Skipping...")
-                    continue
+def collect_results(base_dir, nni_dir, use_manifest=True, workers=1, backend="logs", log_fallback=True,
+                    full_scan=False):
+    """Scan all experiments below `base_dir` and return `(Experiment, [TrialRecord, ...])` pairs."""
 
-                with open(file_path, "r") as f:
-                    experiment_id = f.readline().strip()
+    if backend == "db" and not log_fallback:
+        # Everything comes from the NNI databases, the trial logs are not touched at all
+        scanned = [(experiment, []) for experiment in find_experiments(base_dir)]
+    else:
+        # Read every trial.log once; with the manifest only new trials and appended log tails are parsed
+        manifest_path = os.path.join(base_dir, MANIFEST_FILE) if use_manifest else None
+        scanned = scan_trials(base_dir, nni_dir, manifest_path=manifest_path, workers=workers,
+                              full_scan=full_scan)
 
-                # Walk through the trial directories
-                trial_dir = os.path.join(nni_dir, experiment_id, "environments", "local-env", "trials")
-                if not os.path.exists(trial_dir):
-                    continue
+    collected = []
+    for experiment, records in scanned:
+        if backend == "db":
+            db_trials = read_experiment_db(nni_dir, experiment.experiment_id)
+            if db_trials is not None:
+                records = merge_db_trials(experiment, records, db_trials)
+            elif not log_fallback:
+                print(f"No NNI database for experiment {experiment.experiment_id}. Skipping...")
+                continue
+            else:
+                print(f"No NNI database for experiment {experiment.experiment_id}. Using trial logs only...")
+        collected.append((experiment, records))
+    return collected
 
-                results = []
-                # Extract model and dataset names
-                model_name = os.path.basename(os.path.dirname(root))
-                dataset_name = os.path.basename(root)
-                
-                for trial in os.listdir(trial_dir):
-                    trial_log_path = os.path.join(trial_dir, trial, "trial.log")
-                    if not os.path.exists(trial_log_path):
-                        print(f"Trial log {trial_log_path} does not exist. Skipping...")
-                        continue
-                    
-                    # Initialize variables
-                    learning_rate = None
-                    batch_size = None
-                    metrics = {}
-                    for mode in ["eval", "predict"]:
-                        metrics.update({ 
-                            f"{mode}_macro_f1": None,
-                            f"{mode}_macro_precision": None,
-                            f"{mode}_macro_recall": None,
-                            f"{mode}_micro_f1": None,
-                            f"{mode}_micro_precision": None,
-                            f"{mode}_micro_recall": None,
-                            f"{mode}_weighted_f1": None,
-                            f"{mode}_weighted_precision": None,
-                            f"{mode}_weighted_recall": None,
-                        })
-                        # Adjust accuracy metric name based on the task
-                        if "ner" in base_dir:
-                            metrics.update({
-                                f"{mode}_overall_accuracy": None,
-                            })
-                        else:
-                            metrics.update({
-                                f"{mode}_accuracy": None,
-                            })
+def save_results(experiment, records, formats=()):
+    results = [record.results_row() for record in records]
 
-                    try:
-                        with open(trial_log_path, "r") as trial_log:
-                            for line in trial_log:
-                                if line.startswith("learning_rate"):
-                                    learning_rate = float(re.search(r"learning_rate=([\d.eE+-]+)", line).group(1))
-                                if line.startswith("per_device_train_batch_size"):
-                                    batch_size = int(re.search(r"per_device_train_batch_size=([\d]+)", line).group(1))
-                                for metric in metrics.keys():
-                                    if metric in line:
-                                        match = re.search(rf"{metric}\s+=\s+([\d.]+)", line)
-                                        if match:
-                                            metrics[metric] = float(match.group(1))
-                                
-                                # Parse entity-specific metrics
-                                entity_metric_match = re.search(r"predict_([a-zA-Z_)]+)_(f1|precision|recall)\s+=\s+([\d.]+)", line)
-                                if entity_metric_match:
-                                    entity = entity_metric_match.group(1)
-                                    metric_type = entity_metric_match.group(2)
-                                    value = float(entity_metric_match.group(3))
-                                    
-                                    # Create the metric key in the format predict_ENTITY_metric
-                                    entity_metric_key = f"predict_{entity}_{metric_type}"
-                                    
-                                    # Add to metrics dictionary if not already there
-                                    if entity_metric_key not in metrics:
-                                        metrics[entity_metric_key] = value
+    # Save results to a CSV file (and the requested columnar formats)
+    output_file = os.path.join(experiment.path, "results.csv")
+    write_table(pd.DataFrame(results), output_file, formats)
+    print(f"Results saved to {output_file}")
 
-                    except Exception as e:
-                        print(f"Error reading trial log {trial_log_path}: {e}")
-                        continue
-                
-                    trial_id = os.path.basename(trial)
+def parse_results(base_dir, nni_dir, use_manifest=True, workers=1, backend="logs", log_fallback=True,
+                  full_scan=False, formats=(), db_path=None, task=None):
+    scanned = collect_results(base_dir, nni_dir, use_manifest=use_manifest, workers=workers, backend=backend,
+                              log_fallback=log_fallback, full_scan=full_scan)
+    for experiment, records in scanned:
+        save_results(experiment, records, formats)
+    if db_path is not None:
+        upsert_trials(db_path, trials_to_frame([record for _, records in scanned for record in records]), task=task)
+    return scanned
 
-                    results.append({
-                        "model_name": model_name,
-                        "dataset_name": dataset_name,
-                        "trialJobId": trial_id,
-                        "learning_rate": learning_rate,
-                        "batch_size": batch_size,
-                        **metrics
-                    })
+def update_summaries(base_dir, metric, scanned, formats=()):
+    """Rewrite the csv/ summaries from an in-memory scan instead of re-reading every results.csv."""
+    trials_table = trials_to_frame([record for _, records in scanned for record in records])
+    if trials_table.empty or metric not in trials_table:
+        return
+    build_summaries(base_dir, metric, trials_table, formats=formats)
 
-                # Save results to a CSV file
-                output_file = os.path.join(base_dir, "experiments", model_name, dataset_name, "results.csv")
-                pd.DataFrame(results).to_csv(output_file, index=False)
-                print(f"Results saved to {output_file}")
+def watch_results(base_dir, nni_dir, metric, interval=60, debounce=300, formats=(), db_path=None, task=None,
+                  **kwargs):
+    """
+    Keep results.csv and the csv/ summaries current while a sweep is running.
+
+    The trial logs are polled every `interval` seconds; thanks to the manifest a poll only stats unchanged logs and
+    reads the appended tail of running ones. Experiments whose results changed are rewritten at most once every
+    `debounce` seconds, and with `db_path` upserted into the results warehouse at the same time.
+    """
+    previous = {}
+    pending = set()
+    last_write = None
+    print(f"Watching {base_dir} every {interval}s. Press Ctrl+C to stop.")
+    try:
+        while True:
+            scanned = collect_results(base_dir, nni_dir, **kwargs)
+            for experiment, records in scanned:
+                # Compare serialized rows so NaN metrics do not count as a change on every poll
+                rows = json.dumps([record.results_row() for record in records], sort_keys=True, default=str)
+                if previous.get(experiment.path) != rows:
+                    previous[experiment.path] = rows
+                    pending.add(experiment.path)
+
+            if pending and (last_write is None or time.monotonic() - last_write >= debounce):
+                for experiment, records in scanned:
+                    if experiment.path in pending:
+                        save_results(experiment, records, formats)
+                if db_path is not None:
+                    changed = [record for experiment, records in scanned if experiment.path in pending
+                               for record in records]
+                    if changed:
+                        upsert_trials(db_path, trials_to_frame(changed), task=task)
+                update_summaries(base_dir, metric, scanned, formats)
+                pending.clear()
+                last_write = time.monotonic()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse predict metrics from trial.log files.")
     parser.add_argument("base_dir", type=str, help="Path to directory to search for experiment ids.")
     parser.add_argument("--nni_dir", type=str, default="~/nni-experiments", help="Optional path to NNI directory.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--backend", type=str, choices=["logs", "db"], default="logs",
+                        help="Read hyperparameters and reported results from the trial logs or from NNI's db/nni.sqlite.")
+    parser.add_argument("--no_log_fallback", action="store_true",
+                        help="With --backend db, do not scan the trial logs for metrics NNI does not know about.")
+    parser.add_argument("--full_scan", action="store_true",
+                        help="Read the whole trial logs instead of only the final metric sections at their end.")
+    parser.add_argument("--no_manifest", action="store_true", help="Ignore the scan manifest and re-read every trial log.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep polling the trial logs and update results.csv and the csv/ summaries as trials finish.")
+    parser.add_argument("--interval", type=int, default=60, help="Seconds between two polls in --watch mode.")
+    parser.add_argument("--debounce", type=int, default=300,
+                        help="Minimum number of seconds between two rewrites of the results in --watch mode.")
+    parser.add_argument("--metric", type=str, default="eval_micro_f1",
+                        help="Metric to optimize for the csv/ summaries written in --watch mode.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Also store the parsed trials in this SQLite results warehouse (see results_db.py).")
+    parser.add_argument("--task", type=str, default=None,
+                        help="Task stored with the experiments in --db (default: the name of the directory that "
+                             "contains each experiments/ directory, e.g. cls or ner).")
     args = parser.parse_args()
 
     base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
     nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
-    parse_results(base_dir, nni_dir=nni_dir)
+    kwargs = dict(use_manifest=not args.no_manifest, workers=args.workers, backend=args.backend,
+                  log_fallback=not args.no_log_fallback, full_scan=args.full_scan)
+    db_path = os.path.abspath(os.path.expanduser(args.db)) if args.db else None
+    if args.watch:
+        watch_results(base_dir, nni_dir, args.metric, interval=args.interval, debounce=args.debounce,
+                      formats=args.formats, db_path=db_path, task=args.task, **kwargs)
+    else:
+        parse_results(base_dir, nni_dir=nni_dir, formats=args.formats, db_path=db_path, task=args.task, **kwargs)
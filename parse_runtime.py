@@ -1,105 +1,74 @@
 import os
-import re
 import pandas as pd
 import argparse
 from datetime import timedelta
 
-def parse_runtime(base_dir, metric, nni_dir, print_results=False):
-    results = []
-
-    # Walk through the directory structure
-    for root, _, files in os.walk(base_dir):
-        for file in files:
-            experiment_id = None
-            if file == "experiment_id.txt":
-                file_path = os.path.join(root, file)
-                if not os.path.exists(file_path):
-                    print(f"File {file_path} does not exist. Skipping...")
-                    continue
-
-                with open(file_path, "r") as f:
-                    experiment_id = f.readline().strip()
-
-                # Walk through the trial directories
-                trial_dir = os.path.join(nni_dir, experiment_id, "environments", "local-env", "trials")
-                if not os.path.exists(trial_dir):
-                    continue
-
-                total_runtime = 0
-                for trial in os.listdir(trial_dir):
-                    trial_log_path = os.path.join(trial_dir, trial, "trial.log")
-                    if not os.path.exists(trial_log_path):
-                        continue
-
-                    try:
-                        with open(trial_log_path, "r") as trial_log:
-                            for line in trial_log:
-                                if "train_runtime" in line:
-                                    match = re.search(r"train_runtime\s+=\s+([\d:.]+)", line)
-                                    if match:
-                                        # Parse the runtime using datetime.timedelta
-                                        time_parts = match.group(1).split(':')
-                                        # Format is H:MM:SS.SS
-                                        runtime = timedelta(hours=int(time_parts[0]), 
-                                                            minutes=int(time_parts[1]), 
-                                                            seconds=float(time_parts[2])).total_seconds()
-                                        total_runtime += runtime
-                    except Exception as e:
-                        print(f"Error reading trial log {trial_log_path}: {e}")
-                        continue
-
-                file_path = os.path.join(root, "results.csv")
-                if not os.path.exists(file_path):
-                    continue  # Skip if the file does not exist
-
-                try:
-                    df = pd.read_csv(file_path)
-                    best_row = df.loc[df[metric].idxmax()]
-                    trial_id = best_row['trialJobId']
-                    trial_log_path = os.path.join(nni_dir, experiment_id, "environments", "local-env", "trials", trial_id, "trial.log")
-
-                    # Initialize variables
-                    train_runtime = None
-                    predict_runtime = None
-
-                    # Read the log file
-                    with open(trial_log_path, "r") as f:
-                        for line in f:
-                            # Extract train_runtime
-                            if "train_runtime" in line:
-                                match = re.search(r"train_runtime\s+=\s+([\d:.]+)", line)
-                                if match:
-                                    train_runtime = match.group(1)
-
-                            # Extract predict_runtime
-                            if "predict_runtime" in line:
-                                match = re.search(r"predict_runtime\s+=\s+([\d:.]+)", line)
-                                if match:
-                                    predict_runtime = match.group(1)
-
-                    # Extract model and dataset names
-                    model_name = os.path.basename(os.path.dirname(root))
-                    dataset_name = os.path.basename(root)
-
-                    # Append to results if both runtimes are found
-                    if train_runtime and predict_runtime and total_runtime:
-                        results.append({
-                            "model_name": model_name,
-                            "dataset_name": dataset_name,
-                            "train_runtime": train_runtime,
-                            "predict_runtime": predict_runtime,
-                            "total_runtime": str(timedelta(seconds=total_runtime))
-                        })
-                except Exception as e:
-                    print(f"Error processing file {file_path}: {e}")
+from results_io import COLUMNAR_FORMATS, write_table
+from trial_scanner import scan_trials, trials_to_frame, runtime_table, select_best, format_runtime
+
+def runtime_statistics(trial_runtimes):
+    """Per-experiment runtime totals and trial duration statistics, computed with one groupby."""
+    grouped = trial_runtimes.groupby(["model_name", "dataset_name"], sort=False)
+    return grouped.agg(
+        total_runtime=("train_runtime", "sum"),
+        trials=("trial_runtime", "count"),
+        total_eval_runtime=("eval_runtime", "sum"),
+        total_predict_runtime=("predict_runtime", "sum"),
+        mean_trial_runtime=("trial_runtime", "mean"),
+        median_trial_runtime=("trial_runtime", "median"),
+        p95_trial_runtime=("trial_runtime", lambda durations: durations.quantile(0.95)),
+        compute_seconds=("trial_runtime", "sum"),
+    ).reset_index()
+
+def parse_runtime(base_dir, metric, nni_dir, print_results=False, scanned=None, workers=1, full_scan=False,
+                  trials_table=None, best_rows=None, formats=()):
+    # Reuse an existing scan or trial table if the caller already has one
+    if trials_table is None:
+        if scanned is None:
+            scanned = scan_trials(base_dir, nni_dir, workers=workers, full_scan=full_scan)
+        trials_table = trials_to_frame([record for _, records in scanned for record in records])
+    if trials_table.empty:
+        print("No trials found.")
+        return pd.DataFrame()
+
+    # Every runtime and throughput field of every trial comes from the same single scan
+    trial_runtimes = runtime_table(trials_table)
+    statistics = runtime_statistics(trial_runtimes)
+
+    # Runtimes of the best trial come from the same scan, no need to re-read its log
+    if best_rows is None:
+        best_rows = select_best(trials_table, metric)
+    best_runtimes = runtime_table(best_rows)[["model_name", "dataset_name", "train_runtime", "predict_runtime"]]
+    results = best_runtimes.merge(statistics, on=["model_name", "dataset_name"])
+
+    # Keep experiments where both runtimes are found
+    results = results[results["train_runtime"].notna() & results["predict_runtime"].notna() & (results["total_runtime"] > 0)]
+    results = pd.DataFrame({
+        "model_name": results["model_name"],
+        "dataset_name": results["dataset_name"],
+        "train_runtime": results["train_runtime"].map(format_runtime),
+        "predict_runtime": results["predict_runtime"].map(format_runtime),
+        "total_runtime": results["total_runtime"].map(lambda seconds: str(timedelta(seconds=seconds))),
+        "trials": results["trials"],
+        "total_eval_runtime": results["total_eval_runtime"].map(format_runtime),
+        "total_predict_runtime": results["total_predict_runtime"].map(format_runtime),
+        "mean_trial_runtime": results["mean_trial_runtime"].map(format_runtime),
+        "median_trial_runtime": results["median_trial_runtime"].map(format_runtime),
+        "p95_trial_runtime": results["p95_trial_runtime"].map(format_runtime),
+        # One GPU per trial (trialGpuNumber: 1 in the generated configs)
+        "compute_hours": (results["compute_seconds"] / 3600).round(2),
+    }).reset_index(drop=True)
 
     # Save results to a CSV file or print them
     if print_results:
-        for result in results:
+        for result in results.to_dict("records"):
             print(f"Model: {result['model_name']}, Dataset: {result['dataset_name']}, "
               f"Train Runtime: {result['train_runtime']}, Predict Runtime: {result['predict_runtime']}, "
-              f"Total Runtime: {result['total_runtime']}")
+              f"Total Runtime: {result['total_runtime']}, Trials: {result['trials']}, "
+              f"Mean/Median/P95 Trial Runtime: {result['mean_trial_runtime']}/{result['median_trial_runtime']}/"
+              f"{result['p95_trial_runtime']}, Compute Hours: {result['compute_hours']}")
         print(f"Total experiments: {len(results)}")
+        print(f"Total compute hours: {results['compute_hours'].sum():.2f}")
     else:
         # Ensure the 'csv' directory exists
         output_dir = os.path.join(base_dir, "csv")
@@ -107,17 +76,30 @@ def parse_runtime(base_dir, metric, nni_dir, print_results=False):
 
         # Save the results to the 'csv' directory
         output_file = os.path.join(output_dir, "best_runtimes.csv")
-        pd.DataFrame(results).to_csv(output_file, index=False)
+        write_table(results, output_file, formats)
         print(f"Results saved to {output_file}")
 
+        # Per-trial runtimes (in seconds) and throughput, e.g. for budgeting new sweeps
+        output_file = os.path.join(output_dir, "trial_runtimes.csv")
+        write_table(trial_runtimes, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+    return results
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse predict metrics from trial.log files.")
     parser.add_argument("base_dir", type=str, help="Path to directory to search for results.csv files.")
     parser.add_argument("--nni_dir", type=str, default="~/nni-experiments", help="Optional path to NNI directory.")
     parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric to optimize.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--full_scan", action="store_true",
+                        help="Read the whole trial logs instead of only the final metric sections at their end.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
     parser.add_argument("--print", action="store_true", help="Print the results instead of saving to a CSV file.")
     args = parser.parse_args()
 
     base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
     nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
-    parse_runtime(base_dir, args.metric, nni_dir=nni_dir, print_results=args.print)
+    parse_runtime(base_dir, args.metric, nni_dir=nni_dir, print_results=args.print, workers=args.workers,
+                  full_scan=args.full_scan, formats=args.formats)
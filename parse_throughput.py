@@ -0,0 +1,108 @@
+import os
+import json
+import pandas as pd
+import argparse
+
+from results_io import COLUMNAR_FORMATS, write_table
+from trial_scanner import discover_experiments, scan_trials, trials_to_frame
+
+SPLITS = ["train", "eval", "predict"]
+
+# run_classification.py always trains with max_seq_length 512 (default_training_args); the NER experiments set it
+# per dataset in their hpset
+DEFAULT_MAX_SEQ_LENGTH = 512
+
+def experiment_max_seq_length(experiment):
+    """max_seq_length of an experiment from its hpset JSON (the largest value if it is tuned)."""
+    hpset_file = os.path.join(experiment.path, f"hpset_{experiment.model_name}_{experiment.dataset_name}.json")
+    try:
+        with open(hpset_file, "r") as f:
+            values = json.load(f).get("max_seq_length", {}).get("_value")
+    except (OSError, ValueError):
+        values = None
+    return max(values) if values else DEFAULT_MAX_SEQ_LENGTH
+
+def max_seq_lengths(base_dir):
+    return pd.DataFrame(
+        [(experiment.model_name, experiment.dataset_name, experiment_max_seq_length(experiment))
+         for experiment in discover_experiments(base_dir)],
+        columns=["model_name", "dataset_name", "max_seq_length"]
+    ).drop_duplicates(["model_name", "dataset_name"])
+
+def throughput_leaderboard(trials, seq_lengths, by_dataset=False):
+    """
+    Median throughput of every model and batch size, ranked by training tokens per second.
+
+    Tokens per second are estimated as samples per second times the experiment's max_seq_length (inputs are padded
+    to it), which makes datasets with different sequence lengths comparable.
+    """
+    trials = trials.merge(seq_lengths, on=["model_name", "dataset_name"], how="left")
+    trials["max_seq_length"] = trials["max_seq_length"].fillna(DEFAULT_MAX_SEQ_LENGTH)
+    aggregations = {"trials": ("trialJobId", "count")}
+    for split in SPLITS:
+        samples = f"{split}_samples_per_second"
+        if samples not in trials:
+            continue
+        trials[f"{split}_tokens_per_second"] = trials[samples] * trials["max_seq_length"]
+        aggregations[samples] = (samples, "median")
+        aggregations[f"{split}_tokens_per_second"] = (f"{split}_tokens_per_second", "median")
+        if f"{split}_steps_per_second" in trials:
+            aggregations[f"{split}_steps_per_second"] = (f"{split}_steps_per_second", "median")
+
+    keys = ["model_name", "dataset_name", "batch_size"] if by_dataset else ["model_name", "batch_size"]
+    leaderboard = trials.groupby(keys).agg(**aggregations).reset_index()
+    if "train_tokens_per_second" in leaderboard:
+        leaderboard = leaderboard.sort_values("train_tokens_per_second", ascending=False)
+    leaderboard.insert(0, "rank", range(1, len(leaderboard) + 1))
+    return leaderboard.round(2).reset_index(drop=True)
+
+def parse_throughput(base_dir, nni_dir, print_results=False, scanned=None, workers=1, trials_table=None,
+                     by_dataset=False, formats=()):
+    # Reuse an existing scan or trial table if the caller already has one
+    if trials_table is None:
+        if scanned is None:
+            scanned = scan_trials(base_dir, nni_dir, workers=workers)
+        trials_table = trials_to_frame([record for _, records in scanned for record in records])
+    if trials_table.empty or "train_samples_per_second" not in trials_table:
+        print("No throughput found.")
+        return pd.DataFrame()
+
+    results = throughput_leaderboard(trials_table, max_seq_lengths(base_dir), by_dataset=by_dataset)
+
+    # Save results to a CSV file or print them
+    if print_results:
+        for result in results.to_dict("records"):
+            print(f"{result['rank']}. Model: {result['model_name']}, "
+                  + (f"Dataset: {result['dataset_name']}, " if by_dataset else "")
+                  + f"Batch Size: {result['batch_size']}, "
+                  f"Train: {result['train_samples_per_second']} samples/s ({result['train_tokens_per_second']} tokens/s), "
+                  f"Predict: {result.get('predict_samples_per_second')} samples/s "
+                  f"({result.get('predict_tokens_per_second')} tokens/s), Trials: {result['trials']}")
+        print(f"Total entries: {len(results)}")
+    else:
+        # Ensure the 'csv' directory exists
+        output_dir = os.path.join(base_dir, "csv")
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Save the results to the 'csv' directory
+        output_file = os.path.join(output_dir, "throughput_leaderboard.csv")
+        write_table(results, output_file, formats)
+        print(f"Results saved to {output_file}")
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank models by the training and inference throughput of their trials.")
+    parser.add_argument("base_dir", type=str, help="Path to directory to search for experiment ids.")
+    parser.add_argument("--nni_dir", type=str, default="~/nni-experiments", help="Optional path to NNI directory.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to parse trial logs.")
+    parser.add_argument("--by_dataset", action="store_true", help="Rank every model, dataset and batch size separately.")
+    parser.add_argument("--format", type=str, nargs="+", default=[], choices=COLUMNAR_FORMATS, dest="formats",
+                        help="Also write the tables as Parquet and/or Feather files next to the CSV files.")
+    parser.add_argument("--print", action="store_true", help="Print the results instead of saving to a CSV file.")
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.expanduser(args.base_dir))
+    nni_dir = os.path.abspath(os.path.expanduser(args.nni_dir))
+    parse_throughput(base_dir, nni_dir, print_results=args.print, workers=args.workers, by_dataset=args.by_dataset,
+                     formats=args.formats)
@@ -0,0 +1,290 @@
+"""
+A local SQLite warehouse of all experiments, trials and metrics.
+
+parse_results.py, parse_all.py and learning_curves.py upsert what they parse with `--db <path>`; the CLI of this
+module answers the questions of the parse_best_* scripts (and any other SQL query) from the indexed tables instead
+of reloading every results.csv:
+
+    python results_db.py results.sqlite best_hyperparams --metric eval_micro_f1 --task ner
+    python results_db.py results.sqlite query --sql "SELECT ... FROM final_metrics WHERE metric = 'predict_micro_f1'"
+"""
+import os
+import sqlite3
+import argparse
+
+import pandas as pd
+
+from parse_entity_metrics import is_entity_metric
+from trial_scanner import FIDELITY_COLUMN
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    experiment_id TEXT PRIMARY KEY,
+    task TEXT,
+    model_name TEXT NOT NULL,
+    dataset_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trials (
+    experiment_id TEXT NOT NULL REFERENCES experiments (experiment_id),
+    trialJobId TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (experiment_id, trialJobId)
+);
+CREATE TABLE IF NOT EXISTS hyperparameters (
+    experiment_id TEXT NOT NULL,
+    trialJobId TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (experiment_id, trialJobId, name)
+);
+CREATE TABLE IF NOT EXISTS final_metrics (
+    experiment_id TEXT NOT NULL,
+    trialJobId TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (experiment_id, trialJobId, metric)
+);
+CREATE TABLE IF NOT EXISTS epoch_metrics (
+    experiment_id TEXT NOT NULL,
+    trialJobId TEXT NOT NULL,
+    epoch REAL NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (experiment_id, trialJobId, epoch, metric)
+);
+CREATE INDEX IF NOT EXISTS experiments_model_dataset ON experiments (model_name, dataset_name);
+CREATE INDEX IF NOT EXISTS experiments_dataset ON experiments (dataset_name);
+CREATE INDEX IF NOT EXISTS trials_trial ON trials (trialJobId);
+CREATE INDEX IF NOT EXISTS hyperparameters_name_value ON hyperparameters (name, value);
+CREATE INDEX IF NOT EXISTS final_metrics_metric_value ON final_metrics (metric, value);
+CREATE INDEX IF NOT EXISTS epoch_metrics_metric ON epoch_metrics (metric, experiment_id);
+"""
+
+# Columns of a trials table that are neither ids nor metrics
+ID_COLUMNS = ["experiment_id", "task", "model_name", "dataset_name", "trialJobId", "status"]
+HYPERPARAMETER_COLUMNS = {"learning_rate": "learning_rate", "batch_size": "per_device_train_batch_size"}
+
+# Metrics of the best trials reported by parse_best_metrics.py
+BEST_METRICS = [
+    "predict_macro_f1",
+    "predict_macro_precision",
+    "predict_macro_recall",
+    "predict_micro_f1",
+    "predict_micro_precision",
+    "predict_micro_recall",
+    "predict_weighted_f1",
+    "predict_weighted_precision",
+    "predict_weighted_recall",
+    "predict_accuracy",
+    "predict_overall_accuracy",
+]
+
+
+def connect(db_path):
+    """Open (and if needed create) the warehouse at `db_path`."""
+    connection = sqlite3.connect(db_path)
+    # WAL lets the query CLI read while a parser (e.g. parse_results --watch) is writing
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return connection
+
+
+def rows(df):
+    """Rows of `df` as tuples of plain Python values, with None for missing values."""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def upsert_trials(db_path, trials_table, task=None):
+    """
+    Insert or update the trials of a table as returned by `trials_to_frame` or `load_results`.
+
+    Ids and status go to `experiments`/`trials`, learning rate and batch size to `hyperparameters` and every other
+    numeric column (metrics, runtimes, throughput) to `final_metrics`. Rows without an experiment id are skipped.
+    The task of the experiments is `task` if given, else the table's task column (see `trial_scanner.Experiment`).
+    """
+    if "experiment_id" not in trials_table:
+        print("No experiment ids in the results. Nothing to store.")
+        return
+    table = trials_table[trials_table["experiment_id"].notna()]
+    if "status" not in table:
+        table = table.assign(status=None)
+    if task is not None or "task" not in table:
+        table = table.assign(task=task)
+
+    experiments = table[["experiment_id", "task", "model_name", "dataset_name"]].drop_duplicates("experiment_id")
+    trial_keys = ["experiment_id", "trialJobId"]
+    hyperparameters = table[trial_keys + [c for c in HYPERPARAMETER_COLUMNS if c in table]]
+    hyperparameters = hyperparameters.rename(columns=HYPERPARAMETER_COLUMNS).melt(trial_keys, var_name="name")
+    metric_columns = [c for c in table.columns
+                      if c not in ID_COLUMNS and c not in HYPERPARAMETER_COLUMNS
+                      and pd.api.types.is_numeric_dtype(table[c])]
+    metrics = table[trial_keys + metric_columns].melt(trial_keys, var_name="metric").dropna(subset=["value"])
+
+    connection = connect(db_path)
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT INTO experiments VALUES (?, ?, ?, ?) ON CONFLICT (experiment_id) DO UPDATE SET "
+                "task = COALESCE(excluded.task, task), model_name = excluded.model_name, "
+                "dataset_name = excluded.dataset_name",
+                rows(experiments)
+            )
+            connection.executemany(
+                "INSERT INTO trials VALUES (?, ?, ?) ON CONFLICT (experiment_id, trialJobId) DO UPDATE SET "
+                "status = COALESCE(excluded.status, status)",
+                rows(table[["experiment_id", "trialJobId", "status"]])
+            )
+            connection.executemany(
+                "INSERT INTO hyperparameters VALUES (?, ?, ?, ?) ON CONFLICT (experiment_id, trialJobId, name) "
+                "DO UPDATE SET value = excluded.value",
+                rows(hyperparameters)
+            )
+            connection.executemany(
+                "INSERT INTO final_metrics VALUES (?, ?, ?, ?) ON CONFLICT (experiment_id, trialJobId, metric) "
+                "DO UPDATE SET value = excluded.value",
+                rows(metrics)
+            )
+    finally:
+        connection.close()
+    print(f"Stored {len(table)} trials of {len(experiments)} experiments in {db_path}")
+
+
+def upsert_curves(db_path, curves, task=None):
+    """Insert or update the long-format learning curves of `learning_curves.extract_learning_curves`."""
+    keys = [c for c in ["experiment_id", "task", "model_name", "dataset_name", "trialJobId"] if c in curves]
+    upsert_trials(db_path, curves[keys].drop_duplicates(), task=task)
+    connection = connect(db_path)
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT INTO epoch_metrics VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (experiment_id, trialJobId, epoch, metric) DO UPDATE SET value = excluded.value",
+                rows(curves[["experiment_id", "trialJobId", "epoch", "metric", "value"]])
+            )
+    finally:
+        connection.close()
+    print(f"Stored {len(curves)} learning curve points in {db_path}")
+
+
+def filters(task=None, model=None, dataset=None):
+    """WHERE conditions on the experiments table `e` and their parameters."""
+    conditions = []
+    parameters = []
+    for column, value in [("task", task), ("model_name", model), ("dataset_name", dataset)]:
+        if value is not None:
+            conditions.append(f"e.{column} = ?")
+            parameters.append(value)
+    return "".join(f" AND {condition}" for condition in conditions), parameters
+
+
+def best_trials(connection, metric, task=None, model=None, dataset=None):
+    """
+    Best trial of every experiment by `metric` among its trials at the highest fidelity (train_fraction, full data if
+    not stored); ties go to the first trial id, as in `select_best`.
+    """
+    where, parameters = filters(task, model, dataset)
+    return pd.read_sql_query(
+        f"""
+        WITH ranked AS (
+            SELECT m.experiment_id, m.trialJobId, m.value,
+                   ROW_NUMBER() OVER (PARTITION BY m.experiment_id
+                                      ORDER BY COALESCE(f.value, 1.0) DESC, m.value DESC, m.trialJobId) AS rank
+            FROM final_metrics m
+            LEFT JOIN final_metrics f
+                ON f.experiment_id = m.experiment_id AND f.trialJobId = m.trialJobId AND f.metric = ?
+            WHERE m.metric = ? AND m.value IS NOT NULL
+        )
+        SELECT e.experiment_id, e.task, e.model_name, e.dataset_name, r.trialJobId, r.value
+        FROM ranked r JOIN experiments e USING (experiment_id)
+        WHERE r.rank = 1{where}
+        ORDER BY e.task, e.model_name, e.dataset_name
+        """,
+        connection, params=[FIDELITY_COLUMN, metric, *parameters]
+    ).rename(columns={"value": metric})
+
+
+def best_values(connection, best, table, name_column, names=None):
+    """Values of the best trials from `table`, pivoted to one column per name."""
+    if best.empty:
+        return best
+    keys = best[["experiment_id", "trialJobId"]]
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS best (experiment_id TEXT, trialJobId TEXT)")
+    connection.execute("DELETE FROM best")
+    connection.executemany("INSERT INTO best VALUES (?, ?)", rows(keys))
+    condition = f" AND t.{name_column} IN ({', '.join('?' * len(names))})" if names else ""
+    values = pd.read_sql_query(
+        f"SELECT t.experiment_id, t.trialJobId, t.{name_column}, t.value FROM {table} t "
+        f"JOIN best b ON t.experiment_id = b.experiment_id AND t.trialJobId = b.trialJobId{condition}",
+        connection, params=names or []
+    )
+    values = values.pivot_table(index=["experiment_id", "trialJobId"], columns=name_column, values="value",
+                                aggfunc="first").reset_index()
+    return best.merge(values, on=["experiment_id", "trialJobId"], how="left")
+
+
+def best_hyperparams(connection, metric, **kwargs):
+    """Learning rate and batch size of the best trials (parse_best_hparams.py)."""
+    best = best_values(connection, best_trials(connection, metric, **kwargs), "hyperparameters", "name")
+    best = best.rename(columns={"per_device_train_batch_size": "batch_size"})
+    if "batch_size" in best:
+        best["batch_size"] = best["batch_size"].astype("Int64")
+    return best.reindex(columns=["task", "model_name", "dataset_name", "learning_rate", "batch_size"])
+
+
+def best_metrics(connection, metric, **kwargs):
+    """Aggregate predict metrics of the best trials (parse_best_metrics.py)."""
+    best = best_values(connection, best_trials(connection, metric, **kwargs), "final_metrics", "metric",
+                       names=BEST_METRICS)
+    return best.reindex(columns=["task", "model_name", "dataset_name", *[m for m in BEST_METRICS if m in best]])
+
+
+def entity_metrics(connection, metric, **kwargs):
+    """Entity metrics of the best trials (parse_entity_metrics.py), one row per model and dataset."""
+    best = best_values(connection, best_trials(connection, metric, **kwargs), "final_metrics", "metric")
+    columns = [column for column in best.columns if is_entity_metric(column)]
+    return best[["task", "model_name", "dataset_name", *columns]].dropna(axis=1, how="all")
+
+
+def run_query(connection, sql):
+    return pd.read_sql_query(sql, connection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the SQLite results warehouse.")
+    parser.add_argument("db", type=str, help="Path to the SQLite database written with --db by the parse scripts.")
+    parser.add_argument("command", type=str, choices=["best_hyperparams", "best_metrics", "entity_metrics", "query"],
+                        help="Summary to compute, or 'query' to run the SQL statement given with --sql.")
+    parser.add_argument("--metric", type=str, default="eval_micro_f1", help="Metric to optimize.")
+    parser.add_argument("--task", type=str, default=None, help="Only include experiments of this task (ner, cls).")
+    parser.add_argument("--model", type=str, default=None, help="Only include experiments of this model.")
+    parser.add_argument("--dataset", type=str, default=None, help="Only include experiments on this dataset.")
+    parser.add_argument("--sql", type=str, default=None, help="SQL statement for the 'query' command.")
+    parser.add_argument("--output", type=str, default=None, help="Save the result to this CSV file instead of printing it.")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(os.path.expanduser(args.db))
+    if not os.path.exists(db_path):
+        parser.error(f"Database {db_path} does not exist.")
+    if args.command == "query" and not args.sql:
+        parser.error("The 'query' command requires --sql.")
+
+    connection = connect(db_path)
+    try:
+        if args.command == "query":
+            result = run_query(connection, args.sql)
+        else:
+            summary = {"best_hyperparams": best_hyperparams, "best_metrics": best_metrics,
+                       "entity_metrics": entity_metrics}[args.command]
+            result = summary(connection, args.metric, task=args.task, model=args.model, dataset=args.dataset)
+    finally:
+        connection.close()
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"Results saved to {args.output}")
+    else:
+        print(result.to_string(index=False))
+        print(f"Total rows: {len(result)}")
@@ -0,0 +1,146 @@
+"""
+Helpers for writing and reading the result tables.
+
+Every table is written as CSV and, on request, also as Parquet and/or Feather next to it (`results.csv`,
+`results.parquet`, `results.feather`). The columnar files use an explicit schema, so identifiers stay strings and
+hyperparameters keep their types, and they can be read back with column projection. pyarrow is only needed for
+the columnar formats.
+"""
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columnar formats in the order they are preferred when reading
+COLUMNAR_FORMATS = ("parquet", "feather")
+
+STRING_COLUMNS = {"model_name", "dataset_name", "experiment_id", "trialJobId", "status"}
+INTEGER_COLUMNS = {"batch_size", "per_device_train_batch_size", "trials"}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Writing or reading Parquet/Feather tables requires pyarrow (pip install pyarrow).")
+
+
+def table_path(output_file, fmt):
+    """Path of the `fmt` version of the table whose CSV path is `output_file`."""
+    return f"{os.path.splitext(output_file)[0]}.{fmt}"
+
+
+def column_type(name, dtype, values):
+    if name in STRING_COLUMNS:
+        return pa.string()
+    if name in INTEGER_COLUMNS:
+        return pa.int64()
+    if pd.api.types.is_bool_dtype(dtype):
+        return pa.bool_()
+    if pd.api.types.is_numeric_dtype(dtype) or values.isna().all():
+        # Columns without any value are metrics or hyperparameters that were not reported
+        return pa.float64()
+    return pa.string()
+
+
+def table_schema(df):
+    """
+    Explicit Arrow schema for a result table.
+
+    Identifiers are strings, batch sizes and counts are (nullable) integers and all other numeric columns,
+    including metrics, runtimes and learning rates, are float64.
+    """
+    require_pyarrow()
+    return pa.schema([(str(name), column_type(str(name), values.dtype, values)) for name, values in df.items()])
+
+
+def to_arrow(df):
+    return pa.Table.from_pandas(df, schema=table_schema(df), preserve_index=False)
+
+
+def write_atomic(write, output_file):
+    """
+    Call `write(path)` on a temporary file next to `output_file` and move it into place.
+
+    Readers (e.g. a notebook polling results.csv during a sweep) therefore never see a half-written file.
+    """
+    tmp_path = f"{output_file}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_file)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_csv(df, output_file, index=False):
+    """Write `df` to `output_file` atomically."""
+    write_atomic(lambda path: df.to_csv(path, index=index), output_file)
+
+
+def write_table(df, output_file, formats=(), index=False):
+    """
+    Write `df` atomically as CSV and in each of the columnar `formats` ("parquet", "feather").
+
+    `output_file` is the path of the CSV table; the columnar tables are written next to it with their own extension
+    and store the index as a regular column.
+    """
+    write_csv(df, output_file, index=index)
+    if not formats:
+        return
+    table = to_arrow(df.reset_index() if index else df)
+    for fmt in formats:
+        if fmt == "parquet":
+            write_atomic(lambda path: pq.write_table(table, path), table_path(output_file, fmt))
+        elif fmt == "feather":
+            write_atomic(lambda path: feather.write_feather(table, path), table_path(output_file, fmt))
+        else:
+            raise ValueError(f"Unknown table format: {fmt}")
+
+
+def table_columns(path, fmt):
+    """Column names of a stored table, read from its schema or header only."""
+    if fmt == "parquet":
+        return pq.read_schema(path).names
+    if fmt == "feather":
+        return feather.read_table(path, memory_map=True).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_table(output_file, columns=None):
+    """
+    Read the table whose CSV path is `output_file`.
+
+    A Parquet or Feather version is preferred if pyarrow is available and the file is at least as new as the CSV.
+    `columns` projects the table: a list of column names (missing ones are skipped) or a predicate on the column
+    name. Only the selected columns are read from columnar files. Returns None if no version of the table exists.
+    """
+    candidates = []
+    if pa is not None:
+        candidates.extend((fmt, table_path(output_file, fmt)) for fmt in COLUMNAR_FORMATS)
+    candidates.append(("csv", output_file))
+    csv_mtime = os.stat(output_file).st_mtime if os.path.exists(output_file) else None
+
+    for fmt, path in candidates:
+        if not os.path.exists(path):
+            continue
+        if fmt != "csv" and csv_mtime is not None and os.stat(path).st_mtime < csv_mtime:
+            # Stale columnar copy, e.g. written by an earlier run with --format parquet
+            continue
+        selected = None
+        if columns is not None:
+            available = table_columns(path, fmt)
+            if callable(columns):
+                selected = [name for name in available if columns(name)]
+            else:
+                selected = [name for name in columns if name in available]
+        if fmt == "parquet":
+            return pd.read_parquet(path, columns=selected)
+        if fmt == "feather":
+            return pd.read_feather(path, columns=selected)
+        return pd.read_csv(path, usecols=selected, dtype={name: str for name in STRING_COLUMNS})
+    return None
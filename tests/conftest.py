@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts are run from the repository root (and benchmark/), not installed as a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmark")]
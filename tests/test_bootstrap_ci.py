@@ -0,0 +1,35 @@
+import pytest
+
+from bootstrap_ci import read_gold
+
+
+def test_read_gold_from_predictions_file(tmp_path):
+    path = tmp_path / "predictions.txt"
+    path.write_text("B-PER I-PER O\nO B-LOC\n")
+    assert read_gold(str(path), "ner") == [["B-PER", "I-PER", "O"], ["O", "B-LOC"]]
+
+
+def test_read_gold_from_saved_dataset(tmp_path):
+    datasets = pytest.importorskip("datasets")
+    tags = datasets.Sequence(datasets.ClassLabel(names=["O", "B-PER", "I-PER"]))
+    features = datasets.Features({"tokens": datasets.Sequence(datasets.Value("string")), "ner_tags": tags})
+    dataset = datasets.DatasetDict({
+        split: datasets.Dataset.from_dict({"tokens": [["Anna", "Meyer", "kam"]], "ner_tags": [[1, 2, 0]]},
+                                          features=features)
+        for split in ["train", "test"]
+    })
+    # The dataset paths of create_hpsets_configs.py are save_to_disk directories
+    dataset.save_to_disk(str(tmp_path / "dataset"))
+    assert read_gold(str(tmp_path / "dataset"), "ner") == [["B-PER", "I-PER", "O"]]
+
+    dataset["test"].save_to_disk(str(tmp_path / "test_split"))
+    assert read_gold(str(tmp_path / "test_split"), "ner") == [["B-PER", "I-PER", "O"]]
+
+
+def test_read_gold_from_saved_classification_dataset(tmp_path):
+    datasets = pytest.importorskip("datasets")
+    features = datasets.Features({"text": datasets.Value("string"),
+                                  "label": datasets.ClassLabel(names=["negative", "positive"])})
+    test = datasets.Dataset.from_dict({"text": ["gut", "schlecht"], "label": [1, 0]}, features=features)
+    datasets.DatasetDict({"test": test}).save_to_disk(str(tmp_path / "dataset"))
+    assert read_gold(str(tmp_path / "dataset"), "cls") == ["positive", "negative"]
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pandas as pd
+
+from generate_nni_tree import generate_tree
+from results_db import best_trials, connect, upsert_trials
+from trial_scanner import scan_trials, trials_to_frame
+
+TABLES = ["experiments", "trials", "hyperparameters", "final_metrics"]
+
+
+def dump(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return {table: pd.read_sql_query(f"SELECT * FROM {table} ORDER BY 1, 2", connection) for table in TABLES}
+
+
+def scanned_table(tmp_path):
+    # "ner" in the path must not make the cls experiments ner experiments
+    task_dir, nni_dir = generate_tree(str(tmp_path / "home" / "turner"), task="cls", models=2, datasets=2, trials=4,
+                                      epochs=2, steps_per_epoch=100)
+    scanned = scan_trials(task_dir, nni_dir)
+    return trials_to_frame([record for _, records in scanned for record in records])
+
+
+def test_upsert_trials_is_idempotent(tmp_path):
+    table = scanned_table(tmp_path)
+    db_path = str(tmp_path / "results.sqlite")
+    upsert_trials(db_path, table)
+    first = dump(db_path)
+    upsert_trials(db_path, table)
+    second = dump(db_path)
+    for name in TABLES:
+        pd.testing.assert_frame_equal(first[name], second[name])
+    assert len(first["trials"]) == len(table)
+    assert set(first["experiments"]["task"]) == {"cls"}
+
+
+def test_upsert_trials_task_argument_overrides_the_table(tmp_path):
+    db_path = str(tmp_path / "results.sqlite")
+    upsert_trials(db_path, scanned_table(tmp_path), task="ner")
+    assert set(dump(db_path)["experiments"]["task"]) == {"ner"}
+
+
+def test_best_trials_takes_any_metric_name(tmp_path):
+    db_path = str(tmp_path / "results.sqlite")
+    upsert_trials(db_path, scanned_table(tmp_path))
+    connection = connect(db_path)
+    try:
+        best = best_trials(connection, "eval_macro_f1")
+        assert len(best) == 4 and best["eval_macro_f1"].notna().all()
+        assert best_trials(connection, "x AS y; DROP TABLE experiments; --").empty
+        assert len(best_trials(connection, "eval_macro_f1")) == 4
+    finally:
+        connection.close()
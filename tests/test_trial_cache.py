@@ -0,0 +1,83 @@
+import ast
+import gzip
+import io
+import logging
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+from generate_nni_tree import trial_log
+from trial_scanner import TrialRecord, runtime_table, scan_trial_log, scan_trial_log_tail, trials_to_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeNNI:
+    def __init__(self):
+        self.reported = []
+
+    def report_intermediate_result(self, result):
+        self.reported.append(result)
+
+    def report_final_result(self, result):
+        self.reported.append(result)
+
+
+def load_replay(script):
+    """`replay_cached_trial` of a run script, which cannot be imported here without transformers and nni."""
+    path = os.path.join(ROOT, script)
+    with open(path) as f:
+        module = ast.parse(f.read())
+    nodes = [node for node in module.body
+             if isinstance(node, ast.FunctionDef) and node.name == "replay_cached_trial"
+             or isinstance(node, ast.Assign) and node.targets[0].id in ("PREDICTIONS_FILE", "FINAL_SECTION_MARKER")]
+    namespace = {"gzip": gzip, "io": io, "os": os, "shutil": shutil, "sys": sys, "zstandard": None,
+                 "logger": logging.getLogger(script), "nni": FakeNNI()}
+    exec(compile(ast.Module(nodes, type_ignores=[]), path, "exec"), namespace)
+    return namespace["replay_cached_trial"], namespace["nni"]
+
+
+def scan(path, tail=True):
+    record = TrialRecord("model", "dataset", "experiment", os.path.basename(os.path.dirname(path)))
+    (scan_trial_log_tail if tail else scan_trial_log)(record, path)
+    return record
+
+
+@pytest.mark.parametrize("script", ["ner/run_ner.py", "cls/run_classification.py"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_replayed_trial_has_metrics_but_no_runtimes(tmp_path, capsys, script, compress):
+    replay_cached_trial, nni = load_replay(script)
+    text, intermediate, final = trial_log(random.Random(0), "ner", ["PER"], 5e-05, 16, epochs=2, steps_per_epoch=100,
+                                          failed=False)
+    cached_log = tmp_path / "cached" / "trial.log"
+    cached_log.parent.mkdir()
+    cached_log.write_text(text)
+    cached = scan(str(cached_log))
+    if compress:
+        # archive_logs.py compressed the cached trial's log in the meantime
+        with gzip.open(f"{cached_log}.gz", "wt") as f:
+            f.write(text)
+        cached_log.unlink()
+
+    replay_dir = tmp_path / "replayed"
+    replay_dir.mkdir()
+    entry = {"trial_id": "cached", "trial_log": str(cached_log), "output_dir": str(cached_log.parent),
+             "intermediate_results": intermediate, "final_result": final}
+    replay_cached_trial(entry, str(replay_dir))
+    (replay_dir / "trial.log").write_text(capsys.readouterr().out)
+
+    assert nni.reported == [*intermediate, final]
+    # Only the hyperparameters and the final sections, not the training progress
+    assert os.path.getsize(replay_dir / "trial.log") < len(text) / 2
+    for tail in [True, False]:
+        replayed = scan(str(replay_dir / "trial.log"), tail=tail)
+        assert replayed.replayed_from == "cached"
+        assert (replayed.learning_rate, replayed.batch_size, replayed.metrics) == \
+            (cached.learning_rate, cached.batch_size, cached.metrics)
+        assert replayed.runtimes == {} and replayed.throughput == {}
+    assert cached.runtimes
+    runtimes = runtime_table(trials_to_frame([cached, replayed]))
+    assert runtimes["trial_runtime"].notna().tolist() == [True, False]
@@ -0,0 +1,94 @@
+import glob
+import gzip
+import os
+import random
+
+import pytest
+
+from generate_nni_tree import generate_tree, trial_log
+from trial_scanner import (MANIFEST_FILE, TRIALS_SUBDIR, TrialRecord, discover_experiments, load_results,
+                           scan_compressed_trial_log, scan_trial_log, scan_trial_log_tail, scan_trials, select_best)
+
+
+def new_record():
+    return TrialRecord("model", "dataset", "experiment", "trial")
+
+
+@pytest.fixture
+def log_text():
+    text, _, _ = trial_log(random.Random(0), "ner", ["PER", "LOC"], 2e-05, 32, epochs=2, steps_per_epoch=100,
+                           failed=False)
+    return text.encode()
+
+
+@pytest.mark.parametrize("fraction", [0.1, 0.5, 0.9, 0.97, 1.0])
+def test_tail_scan_matches_full_scan_on_truncated_logs(tmp_path, log_text, fraction):
+    path = tmp_path / "trial.log"
+    path.write_bytes(log_text[:int(len(log_text) * fraction)])
+    full, tail = new_record(), new_record()
+    assert scan_trial_log_tail(tail, str(path)) == scan_trial_log(full, str(path))
+    assert tail == full
+
+
+def test_tail_scan_matches_full_scan_on_compressed_logs(tmp_path, log_text):
+    path = tmp_path / "trial.log"
+    path.write_bytes(log_text)
+    with gzip.open(tmp_path / "trial.log.gz", "wb") as f:
+        f.write(log_text)
+    full, tail, streamed = new_record(), new_record(), new_record()
+    scan_trial_log(full, str(path))
+    assert scan_compressed_trial_log(tail, str(path) + ".gz") == len(log_text)
+    scan_compressed_trial_log(streamed, str(path) + ".gz", full_scan=True)
+    assert tail == full
+    assert streamed == full
+
+
+@pytest.mark.parametrize("cut", [26, 200, 600])
+def test_resumed_tail_scan_reads_hyperparameters(tmp_path, log_text, cut):
+    # A scan while the TrainingArguments were not written yet, resumed after the trial finished
+    path = tmp_path / "trial.log"
+    path.write_bytes(log_text[:cut])
+    resumed = new_record()
+    offset = scan_trial_log_tail(resumed, str(path))
+    path.write_bytes(log_text)
+    scan_trial_log_tail(resumed, str(path), offset)
+
+    full = new_record()
+    scan_trial_log(full, str(path))
+    assert (resumed.learning_rate, resumed.batch_size) == (2e-05, 32)
+    assert resumed == full
+
+
+@pytest.mark.parametrize("full_scan", [False, True])
+def test_incremental_manifest_scan_matches_full_scan(tmp_path, full_scan):
+    task_dir, nni_dir = generate_tree(str(tmp_path), models=2, datasets=1, trials=6, epochs=2, steps_per_epoch=100)
+    logs = sorted(glob.glob(os.path.join(nni_dir, "*", TRIALS_SUBDIR, "*", "trial.log")))
+    texts = {}
+    for i, path in enumerate(logs):
+        with open(path, "rb") as f:
+            texts[path] = f.read()
+        # Trials caught at different points: before the TrainingArguments, while training, in the final sections
+        with open(path, "wb") as f:
+            f.write(texts[path][:[26, len(texts[path]) // 2, len(texts[path]) - 100][i % 3]])
+
+    manifest_path = os.path.join(task_dir, MANIFEST_FILE)
+    scan_trials(task_dir, nni_dir, manifest_path=manifest_path, full_scan=full_scan)
+    for path, text in texts.items():
+        with open(path, "wb") as f:
+            f.write(text)
+    incremental = scan_trials(task_dir, nni_dir, manifest_path=manifest_path, full_scan=full_scan)
+    # Unchanged logs are restored from the manifest
+    assert scan_trials(task_dir, nni_dir, manifest_path=manifest_path, full_scan=full_scan) == incremental
+    assert incremental == scan_trials(task_dir, nni_dir, full_scan=full_scan)
+
+
+def test_select_best_keeps_tasks_apart_on_the_repository_root(tmp_path):
+    # The same model and dataset names in cls/ and ner/
+    for task, scores in [("cls", [0.7, 0.9]), ("ner", [0.8, 0.6])]:
+        experiment = tmp_path / task / "experiments" / "gbert" / "bronco"
+        experiment.mkdir(parents=True)
+        (experiment / "results.csv").write_text("trialJobId,learning_rate,batch_size,eval_micro_f1\n"
+                                                f"a,1e-05,16,{scores[0]}\nb,2e-05,32,{scores[1]}\n")
+    best = select_best(load_results(str(tmp_path)), "eval_micro_f1")
+    assert sorted(zip(best["task"], best["trialJobId"])) == [("cls", "b"), ("ner", "a")]
+    assert [experiment.task for experiment in discover_experiments(str(tmp_path))] == ["cls", "ner"]
@@ -0,0 +1,674 @@
+"""
+Shared scanner for NNI trial logs.
+
+Every trial.log below `<nni_dir>/<experiment_id>/environments/local-env/trials/` is read exactly once and turned
+into a `TrialRecord`. The parse_* scripts consume these records (or the results.csv files written from them)
+instead of walking the directory tree and re-reading the logs themselves.
+
+By default only the final metric sections at the end of each log and the hyperparameters at its beginning are
+read; a full scan of the whole log is only needed for per-epoch (intermediate) metrics.
+
+With a manifest (path, inode, size, mtime and last parsed byte offset per log) a re-run skips unchanged logs entirely
+and only parses the appended tail of logs that grew since the previous scan.
+
+Logs compressed by archive_logs.py (`trial.log.gz`, or `trial.log.zst` if the zstandard package is installed) are
+decompressed on the fly while they are read.
+"""
+import gzip
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Optional
+
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from results_io import read_table
+
+TRIALS_SUBDIR = os.path.join("environments", "local-env", "trials")
+# Names of a trial's log, in the order they are looked for; archive_logs.py replaces trial.log by a compressed copy
+TRIAL_LOG_NAMES = ("trial.log", "trial.log.gz", "trial.log.zst")
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+EXPERIMENTS_DIR = "experiments"
+INDEX_FILE = ".experiment_index.json"
+MANIFEST_FILE = ".trial_manifest.json"
+INDEX_VERSION = 2
+MANIFEST_VERSION = 4
+THROUGHPUT_SUFFIXES = ("_samples_per_second", "_steps_per_second")
+RUNTIME_COLUMNS = ["train_runtime", "eval_runtime", "predict_runtime"]
+# Fidelity of multi-fidelity (BOHB) trials, logged with the train metrics
+FIDELITY_COLUMN = "train_fraction"
+
+# The final train/eval/predict metric blocks are written at the very end of a trial.log, starting with this line
+FINAL_SECTION_MARKER = b"***** train metrics *****"
+TAIL_BLOCK_SIZE = 64 * 1024
+# Logs without the final sections in their last blocks (failed or still running trials) are scanned forwards instead
+TAIL_MAX_BLOCKS = 16
+# Compressed logs cannot be read backwards and are streamed in blocks of this size instead
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# Matches the two kinds of lines we care about in one pass: the `  key = value` lines written by
+# `Trainer.log_metrics` (any metric name, runtimes as H:MM:SS.SS) and the `learning_rate=...` /
+# `per_device_train_batch_size=...` lines of the logged TrainingArguments. The run scripts end the log of a trial
+# replayed from their trial cache with `replayed_from=<trial_id>`.
+LINE_PATTERN = re.compile(
+    r"(?:\s+(?P<key>[^\s=]+)\s+=\s+(?P<value>\S+)\s*$"
+    r"|(?P<hparam>learning_rate|per_device_train_batch_size|replayed_from)=(?P<hvalue>[^,\s]+))"
+)
+
+
+@dataclass
+class Experiment:
+    """
+    An `experiments/<model>/<dataset>/` directory together with its NNI experiment id and its task (the name of the
+    directory that contains `experiments/`, e.g. cls or ner).
+    """
+
+    model_name: str
+    dataset_name: str
+    path: str
+    experiment_id: Optional[str] = None
+    task: Optional[str] = None
+
+
+@dataclass
+class TrialRecord:
+    """
+    Hyperparameters, metrics, runtimes (in seconds) and throughput (samples/steps per second) extracted from a single
+    trial.log.
+    """
+
+    model_name: str
+    dataset_name: str
+    experiment_id: str
+    trialJobId: str
+    learning_rate: Optional[float] = None
+    batch_size: Optional[int] = None
+    metrics: Dict[str, Optional[float]] = field(default_factory=dict)
+    runtimes: Dict[str, float] = field(default_factory=dict)
+    throughput: Dict[str, float] = field(default_factory=dict)
+    status: Optional[str] = None
+    task: Optional[str] = None
+    # Trial whose cached results this trial replayed; it did not train, so it has no runtimes or throughput
+    replayed_from: Optional[str] = None
+
+    def results_row(self):
+        """Row in the layout of `experiments/<model>/<dataset>/results.csv`."""
+        row = {
+            "model_name": self.model_name,
+            "dataset_name": self.dataset_name,
+            "trialJobId": self.trialJobId,
+            "learning_rate": self.learning_rate,
+            "batch_size": self.batch_size,
+        }
+        # Only known when the results come from the NNI database
+        if self.status is not None:
+            row["status"] = self.status
+        return {**row, **self.metrics}
+
+    def to_dict(self):
+        """Flat row with metrics, runtimes and throughput side by side."""
+        return {
+            "experiment_id": self.experiment_id,
+            "task": self.task,
+            **self.results_row(),
+            **self.runtimes,
+            **self.throughput
+        }
+
+
+def trials_to_frame(records):
+    """Convert a list of `TrialRecord` into a DataFrame with one row per trial."""
+    return pd.DataFrame([record.to_dict() for record in records])
+
+
+def parse_runtime_seconds(value):
+    """Convert a Trainer runtime string (H:MM:SS.SS) into seconds."""
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def format_runtime(seconds):
+    """Format seconds the way the Trainer prints runtimes (H:MM:SS.SS)."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    msec = int(abs(seconds - int(seconds)) * 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{msec:02d}"
+
+
+def runtime_table(trials):
+    """
+    Runtimes, throughput and hyperparameters of every trial in a `trials_to_frame` table.
+
+    `trial_runtime` is the wall time of the trial: training (which includes the per-epoch evaluations) plus the final
+    evaluation and prediction.
+    """
+    columns = ["model_name", "dataset_name", "trialJobId", "learning_rate", "batch_size"]
+    columns += [FIDELITY_COLUMN] if FIDELITY_COLUMN in trials else []
+    columns += [column for column in trials.columns if column.endswith(("_runtime",) + THROUGHPUT_SUFFIXES)]
+    df = trials.reindex(columns=columns)
+    for column in RUNTIME_COLUMNS:
+        if column not in df:
+            df[column] = float("nan")
+    df["trial_runtime"] = df[RUNTIME_COLUMNS].sum(axis=1, min_count=1)
+    return df
+
+
+def experiment_roots(base_dir):
+    """
+    The `experiments/` directories below `base_dir`.
+
+    That is `<base_dir>/experiments`, `base_dir` itself if it is an experiments directory, or
+    `<base_dir>/<task>/experiments` for every task directory (e.g. cls/ and ner/) if run on the repository root.
+    """
+    if os.path.basename(base_dir) == EXPERIMENTS_DIR:
+        return [base_dir]
+    root = os.path.join(base_dir, EXPERIMENTS_DIR)
+    if os.path.isdir(root):
+        return [root]
+
+    roots = []
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            candidate = os.path.join(entry.path, EXPERIMENTS_DIR)
+            if entry.is_dir() and os.path.isdir(candidate):
+                roots.append(candidate)
+    return sorted(roots)
+
+
+def subdirectories(path):
+    with os.scandir(path) as entries:
+        return sorted((entry for entry in entries if entry.is_dir()), key=lambda entry: entry.name)
+
+
+def build_index(base_dir):
+    """
+    List every `<model>/<dataset>/` directory with `os.scandir`, without descending any further.
+
+    Returns the index as stored in the cache: the experiments plus the mtimes needed to tell whether it is stale.
+    """
+    experiments = []
+    directories = {}
+    for root in experiment_roots(base_dir):
+        directories[root] = os.stat(root).st_mtime
+        task = os.path.basename(os.path.dirname(root))
+        for model in subdirectories(root):
+            directories[model.path] = model.stat().st_mtime
+            for dataset in subdirectories(model.path):
+                experiment = {"task": task, "model_name": model.name, "dataset_name": dataset.name,
+                              "path": dataset.path, "experiment_id": None, "id_mtime": None}
+                id_file = os.path.join(dataset.path, "experiment_id.txt")
+                try:
+                    experiment["id_mtime"] = os.stat(id_file).st_mtime
+                    with open(id_file, "r") as f:
+                        experiment["experiment_id"] = f.readline().strip() or None
+                except FileNotFoundError:
+                    pass
+                experiments.append(experiment)
+    return {"version": INDEX_VERSION, "base_dir": base_dir, "directories": directories, "experiments": experiments}
+
+
+def index_is_current(index, base_dir):
+    """
+    An index is current if no model or dataset directory was added or removed and no experiment_id.txt was created,
+    changed or removed since it was built. Dataset directories themselves change whenever a results.csv is written,
+    so their mtimes are not used.
+    """
+    if index.get("version") != INDEX_VERSION or index.get("base_dir") != base_dir:
+        return False
+    try:
+        for path, mtime in index["directories"].items():
+            if os.stat(path).st_mtime != mtime:
+                return False
+    except OSError:
+        return False
+    for experiment in index["experiments"]:
+        try:
+            id_mtime = os.stat(os.path.join(experiment["path"], "experiment_id.txt")).st_mtime
+        except FileNotFoundError:
+            id_mtime = None
+        if id_mtime != experiment["id_mtime"]:
+            return False
+    return True
+
+
+def discover_experiments(base_dir, use_cache=True):
+    """
+    Find all `experiments/<model>/<dataset>/` directories below `base_dir`, with or without an experiment id.
+
+    The layout written by create_hpsets_configs.py is known, so only those two levels are listed; trial outputs,
+    checkpoints and csv/ directories are never entered. The index is cached in `<base_dir>/.experiment_index.json`
+    and only rebuilt when experiments or experiment ids were added, changed or removed.
+    """
+    index_path = os.path.join(base_dir, INDEX_FILE)
+    index = None
+    if use_cache and os.path.exists(index_path):
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+    if index is None or not index_is_current(index, base_dir):
+        index = build_index(base_dir)
+        if use_cache:
+            try:
+                tmp_path = f"{index_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, index_path)
+            except OSError as e:
+                print(f"Could not cache experiment index in {index_path}: {e}")
+
+    return [
+        Experiment(
+            model_name=experiment["model_name"],
+            dataset_name=experiment["dataset_name"],
+            path=experiment["path"],
+            experiment_id=experiment["experiment_id"],
+            task=experiment["task"]
+        )
+        for experiment in index["experiments"]
+    ]
+
+
+def find_experiments(base_dir, use_cache=True):
+    """Find all experiment directories below `base_dir` that contain an experiment_id.txt."""
+    return [experiment for experiment in discover_experiments(base_dir, use_cache=use_cache) if experiment.experiment_id]
+
+
+def parse_line(record, line):
+    """Update `record` with whatever the given log line contains."""
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        return
+
+    key = match.group("key")
+    if key is not None:
+        store_metric(record, key, match.group("value"))
+    elif match.group("hparam") == "learning_rate":
+        record.learning_rate = float(match.group("hvalue"))
+    elif match.group("hparam") == "replayed_from":
+        # The replayed final sections hold the runtimes of the cached trial
+        record.replayed_from = match.group("hvalue")
+        record.runtimes.clear()
+        record.throughput.clear()
+    else:
+        record.batch_size = int(match.group("hvalue"))
+
+
+def store_metric(record, key, value):
+    """Store a `key = value` metric line in the matching field of `record`; values that are not numbers are ignored."""
+    try:
+        if key.endswith(("_runtime",) + THROUGHPUT_SUFFIXES) and record.replayed_from is not None:
+            return
+        if key.endswith("_runtime"):
+            record.runtimes[key] = parse_runtime_seconds(value)
+        elif key.endswith(THROUGHPUT_SUFFIXES):
+            record.throughput[key] = float(value)
+        elif key.startswith(("eval_", "predict_")) or key == FIDELITY_COLUMN:
+            record.metrics[key] = float(value)
+    except ValueError:
+        pass
+
+
+def find_trial_log(trial_path):
+    """Path of the (possibly compressed) log in a trial directory, or None if it has none."""
+    for name in TRIAL_LOG_NAMES:
+        trial_log_path = os.path.join(trial_path, name)
+        if os.path.exists(trial_log_path):
+            return trial_log_path
+    return None
+
+
+def is_compressed(trial_log_path):
+    return trial_log_path.endswith(COMPRESSED_SUFFIXES)
+
+
+def open_trial_log(trial_log_path):
+    """Open a trial log for reading bytes, decompressing `.gz` and `.zst` logs on the fly."""
+    if trial_log_path.endswith(".gz"):
+        return gzip.open(trial_log_path, "rb")
+    if trial_log_path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Reading {trial_log_path} requires the zstandard package (pip install zstandard).")
+        return zstandard.ZstdDecompressor().stream_reader(open(trial_log_path, "rb"), closefd=True)
+    return open(trial_log_path, "rb")
+
+
+def scan_compressed_trial_log(record, trial_log_path, full_scan=False):
+    """
+    Fill `record` from a compressed trial log, which is streamed once from start to end.
+
+    Without `full_scan` only the hyperparameter lines and the lines from the last start of the final metric
+    sections on are parsed, as in `scan_trial_log_tail`. Returns the decompressed size of the log.
+    """
+    size = 0
+    pending = b""
+    tail = None
+    with open_trial_log(trial_log_path) as trial_log:
+        while pending is not None:
+            block = trial_log.read(STREAM_BLOCK_SIZE)
+            size += len(block)
+            lines = (pending + block).split(b"\n")
+            # Keep the line cut off at the block boundary for the next round; at the end it is the last line
+            pending = lines.pop() if block else None
+            for line in lines:
+                if full_scan:
+                    parse_line(record, line.decode("utf-8", errors="replace"))
+                elif line.startswith(FINAL_SECTION_MARKER):
+                    tail = [line]
+                elif tail is not None:
+                    tail.append(line)
+                elif line.startswith((b"learning_rate", b"per_device_train_batch_size")):
+                    parse_line(record, line.decode("utf-8", errors="replace"))
+    for line in tail or []:
+        parse_line(record, line.decode("utf-8", errors="replace"))
+    return size
+
+
+def scan_trial_log(record, trial_log_path, offset=0):
+    """
+    Parse `trial_log_path` from byte `offset` on and fill `record` from it.
+
+    Only complete lines are consumed, so a line that is still being written is picked up by the next scan. Returns
+    the byte offset up to which the log has been parsed.
+    """
+    with open(trial_log_path, "rb") as trial_log:
+        trial_log.seek(offset)
+        data = trial_log.read()
+
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].decode("utf-8", errors="replace").splitlines():
+        parse_line(record, line)
+    return offset + end
+
+
+def scan_trial_log_tail(record, trial_log_path, offset=0):
+    """
+    Fill `record` from the final metric sections at the end of `trial_log_path`.
+
+    The log is read backwards in blocks until the start of the final sections is found (or `offset` is reached, e.g.
+    for a trial that is still training), then the hyperparameters are read from `offset` on if they are still
+    missing. For a finished trial this reads a few KB instead of the whole log. If the final sections are not
+    within the last `TAIL_MAX_BLOCKS` blocks, the log is parsed forwards from `offset` like `scan_trial_log`.
+    Returns the byte offset up to which the log has been parsed.
+    """
+    with open(trial_log_path, "rb") as trial_log:
+        position = trial_log.seek(0, os.SEEK_END)
+        blocks = []
+        start = -1
+        while position > offset and start < 0:
+            if len(blocks) == TAIL_MAX_BLOCKS:
+                return scan_trial_log(record, trial_log_path, offset)
+            step = min(TAIL_BLOCK_SIZE, position - offset)
+            position -= step
+            trial_log.seek(position)
+            block = trial_log.read(step)
+            # Only the new block (plus a marker that may straddle the block boundary) has to be searched
+            window = (block + blocks[-1][:len(FINAL_SECTION_MARKER) - 1]) if blocks else block
+            start = window.rfind(FINAL_SECTION_MARKER)
+            blocks.append(block)
+        tail = b"".join(reversed(blocks))
+
+        end = tail.rfind(b"\n") + 1
+        for line in tail[max(start, 0):end].decode("utf-8", errors="replace").splitlines():
+            parse_line(record, line)
+
+        # The TrainingArguments (and with them the hyperparameters) are logged right at the start. A resumed scan
+        # looks for them from `offset` on: an earlier scan may have stopped before they were written
+        head_end = position + max(start, 0)
+        head_position = offset
+        head = b""
+        while head_position < head_end and (record.learning_rate is None or record.batch_size is None):
+            trial_log.seek(head_position)
+            block = trial_log.read(min(TAIL_BLOCK_SIZE, head_end - head_position))
+            head_position += len(block)
+            lines = (head + block).split(b"\n")
+            # Keep the line cut off at the block boundary for the next round
+            head = lines.pop()
+            for line in lines:
+                if line.startswith((b"learning_rate", b"per_device_train_batch_size")):
+                    parse_line(record, line.decode("utf-8", errors="replace"))
+    return position + end
+
+
+def load_manifest(manifest_path):
+    """Load the scan manifest, or return an empty one if it is missing, unreadable or outdated."""
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest {manifest_path}: {e}. Rescanning all trials...")
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("trials", {})
+
+
+def save_manifest(manifest_path, manifest):
+    """Atomically replace the scan manifest."""
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "trials": manifest}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def plan_experiment(experiment, nni_dir, previous=None, full_scan=False):
+    """
+    List the trial logs of one experiment in a deterministic (sorted) order.
+
+    Returns `(trial_log_path, stat, record, offset, unchanged)` tuples. `record` and `offset` are restored from the
+    `previous` manifest entries where possible, so that only the new part of each log has to be parsed; `unchanged`
+    is the previous entry of a log that has not changed since, None otherwise. Entries of a tail-only scan are not
+    reused for a `full_scan`.
+    """
+    trial_dir = os.path.join(nni_dir, experiment.experiment_id, TRIALS_SUBDIR)
+    if not os.path.exists(trial_dir):
+        return []
+
+    plan = []
+    for trial in sorted(os.listdir(trial_dir)):
+        trial_log_path = find_trial_log(os.path.join(trial_dir, trial))
+        if trial_log_path is None:
+            print(f"Trial log {os.path.join(trial_dir, trial, 'trial.log')} does not exist. Skipping...")
+            continue
+
+        try:
+            stat = os.stat(trial_log_path)
+        except OSError as e:
+            print(f"Error reading trial log {trial_log_path}: {e}")
+            continue
+
+        entry = previous.get(trial_log_path) if previous is not None else None
+        reusable = (
+            entry is not None
+            and entry["inode"] == stat.st_ino
+            and (entry.get("full_scan", True) or not full_scan)
+        )
+        if reusable and is_compressed(trial_log_path):
+            # Compressed logs are finished; they are either unchanged or parsed again from the start
+            reusable = entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+        elif reusable:
+            reusable = entry["offset"] <= stat.st_size
+        if reusable:
+            record = TrialRecord(**entry["record"])
+            offset = entry["offset"]
+            unchanged = entry if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime else None
+        else:
+            record = TrialRecord(
+                model_name=experiment.model_name,
+                dataset_name=experiment.dataset_name,
+                experiment_id=experiment.experiment_id,
+                trialJobId=trial,
+                task=experiment.task
+            )
+            offset = 0
+            unchanged = None
+        plan.append((trial_log_path, stat, record, offset, unchanged))
+    return plan
+
+
+def parse_trial(task):
+    """
+    Parse one `(record, trial_log_path, offset, full_scan)` task. Module level so it can run in a worker process.
+    """
+    record, trial_log_path, offset, full_scan = task
+    try:
+        if is_compressed(trial_log_path):
+            return record, scan_compressed_trial_log(record, trial_log_path, full_scan=full_scan)
+        if full_scan:
+            return record, scan_trial_log(record, trial_log_path, offset=offset)
+        return record, scan_trial_log_tail(record, trial_log_path, offset=offset)
+    except Exception as e:
+        print(f"Error reading trial log {trial_log_path}: {e}")
+        return None, offset
+
+
+def parse_planned(plan, manifest=None, workers=1, full_scan=False):
+    """
+    Parse every changed log of `plan`, fanning out over `workers` processes if more than one is requested.
+
+    Returns one record per plan entry, in plan order (None if the log could not be read). If a `manifest` dict is
+    given, it is updated with the state of every parsed log.
+    """
+    tasks = [(record, path, offset, full_scan) for path, _, record, offset, unchanged in plan if unchanged is None]
+    if workers > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = iter(list(executor.map(parse_trial, tasks, chunksize=chunksize)))
+    else:
+        parsed = iter([parse_trial(task) for task in tasks])
+
+    records = []
+    for path, stat, record, offset, unchanged in plan:
+        if unchanged is not None:
+            if manifest is not None:
+                manifest[path] = unchanged
+            records.append(record)
+            continue
+
+        record, offset = next(parsed)
+        if record is not None and manifest is not None:
+            manifest[path] = {
+                "inode": stat.st_ino,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "offset": offset,
+                "full_scan": full_scan,
+                "record": asdict(record)
+            }
+        records.append(record)
+    return records
+
+
+def scan_trials(base_dir, nni_dir, manifest_path=None, workers=1, full_scan=False):
+    """
+    Scan every trial of every experiment below `base_dir`.
+
+    Returns a list of `(Experiment, [TrialRecord, ...])` pairs, one for each experiment that has an NNI trial
+    directory, with trials sorted by id. If `manifest_path` is given, only new trials and the appended tail of grown
+    logs are parsed, and the manifest is rewritten afterwards. With `workers > 1` the trial logs of all experiments
+    are parsed in a process pool. Unless `full_scan` is set, only the final sections at the end of each log (and the
+    hyperparameters at its start) are read.
+    """
+    previous = load_manifest(manifest_path) if manifest_path is not None else None
+    manifest = {} if manifest_path is not None else None
+
+    plans = []
+    for experiment in find_experiments(base_dir):
+        trial_dir = os.path.join(nni_dir, experiment.experiment_id, TRIALS_SUBDIR)
+        if not os.path.exists(trial_dir):
+            continue
+        plans.append((experiment, plan_experiment(experiment, nni_dir, previous=previous, full_scan=full_scan)))
+
+    # Parse the trials of all experiments in one go, then split the records up per experiment again
+    records = parse_planned([entry for _, plan in plans for entry in plan], manifest=manifest, workers=workers,
+                            full_scan=full_scan)
+    scanned = []
+    start = 0
+    for experiment, plan in plans:
+        experiment_records = records[start:start + len(plan)]
+        scanned.append((experiment, [record for record in experiment_records if record is not None]))
+        start += len(plan)
+
+    if manifest is not None:
+        save_manifest(manifest_path, manifest)
+    return scanned
+
+
+def load_results(base_dir, columns=None):
+    """
+    Load the results table of every experiment below `base_dir` into a single DataFrame.
+
+    Parquet/Feather copies of results.csv are preferred when present; `columns` projects the tables (see
+    `results_io.read_table`).
+    """
+    # The fidelity is always read along with a projection so that select_best only compares trials at the same one
+    if callable(columns):
+        predicate = columns
+        columns = lambda name: name == FIDELITY_COLUMN or predicate(name)
+    elif columns is not None:
+        columns = [*columns, FIDELITY_COLUMN]
+    frames = []
+    for experiment in discover_experiments(base_dir):
+        file_path = os.path.join(experiment.path, "results.csv")
+        try:
+            df = read_table(file_path, columns=columns)
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+            continue
+        if df is None:
+            continue
+        df["model_name"] = experiment.model_name
+        df["dataset_name"] = experiment.dataset_name
+        df["experiment_id"] = experiment.experiment_id
+        df["task"] = experiment.task
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["model_name", "dataset_name"])
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def experiment_keys(table):
+    """
+    Columns that identify an experiment in `table`: model and dataset, preceded by the task if the table has one, so
+    that cls and ner experiments with the same names stay apart when run on the repository root.
+    """
+    return ["task", "model_name", "dataset_name"] if "task" in table else ["model_name", "dataset_name"]
+
+
+def highest_fidelity(results_table):
+    """
+    Trials at the highest fidelity (train_fraction) of their experiment; trials without one count as full data.
+
+    Scores and runtimes of trials on a subset of the training data are not comparable to those on the full data.
+    """
+    if FIDELITY_COLUMN not in results_table:
+        return results_table
+    fidelity = results_table[FIDELITY_COLUMN].fillna(1.0)
+    keys = [results_table[key] for key in experiment_keys(results_table)]
+    highest = fidelity.groupby(keys, sort=False, dropna=False).transform("max")
+    return results_table[fidelity == highest]
+
+
+def select_best(results_table, metric):
+    """
+    Best trial of every experiment by `metric`, selected with a single groupby.
+
+    In multi-fidelity experiments only the trials at the highest fidelity (train_fraction) of the experiment compete;
+    scores of trials on a subset of the training data are not comparable.
+    """
+    if metric not in results_table:
+        print(f"Metric {metric} not found in the results.")
+        return results_table.iloc[0:0]
+    valid = highest_fidelity(results_table.dropna(subset=[metric]))
+    best_index = valid.groupby(experiment_keys(valid), sort=False, dropna=False)[metric].idxmax()
+    return results_table.loc[best_index.values]